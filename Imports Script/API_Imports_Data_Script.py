@@ -1,12 +1,23 @@
+import gzip
+import hashlib
+import json
+import os
 import pandas as pd
-import pickle as pkl
 import yaml
 import numpy as np
 import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib.parse import (parse_qsl, urlencode, urlparse, urlsplit,
+                          urlunsplit)
+from urllib3.util.retry import Retry
 
 apiPath = Path(__file__).parent / 'API'
 dataPath = Path(__file__).parent / 'response_data'
+cachePath = dataPath / 'cache'
 conPath = Path(__file__).parent / 'Concordances'
   
 #%%
@@ -122,50 +133,205 @@ def complete_URLs(req_url, year, d):
     year_reqs = l
     return year_reqs
 
-def make_reqs(file, reqs, data_years):
+class RateLimiter:
+    '''
+    Spaces out requests to the same host so that no more than `rate`
+    requests per second are issued to it, across all threads.
+    '''
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            t = max(now, self.next_time.get(host, now))
+            self.next_time[host] = t + self.interval
+        if t > now:
+            time.sleep(t - now)
+
+def get_session(workers, retries=5, backoff=0.5):
+    '''
+    Creates a requests session with a keep-alive connection pool sized to
+    the number of workers, retrying failed and throttled requests with
+    exponential backoff.
+    '''
+    retry = Retry(total=retries, backoff_factor=backoff,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def normalize_url(url):
+    '''
+    Returns the url with lower-cased scheme and host, sorted query
+    parameters and the API key removed, so that it can be used as a cache key.
+    '''
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query)
+                   if k != 'UserID')
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path, urlencode(query), ''))
+
+def get_cache_file(url):
+    key = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+    return cachePath / key[:2] / f'{key}.json.gz'
+
+def read_cache(url, ttl=None):
+    '''
+    Returns the cached response for the url, or None if it is missing,
+    older than ttl seconds, unreadable, e.g. truncated by an interrupted
+    copy, or an error, see get_response_error.
+    '''
+    file = get_cache_file(url)
+    try:
+        if ttl is not None and time.time() - file.stat().st_mtime > ttl:
+            return None
+        with gzip.open(file, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, EOFError, UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    # ^^ OSError includes a missing file and gzip.BadGzipFile
+    return data if get_response_error(data) is None else None
+
+def write_cache(url, data):
+    '''
+    Stores the response as compressed json. The file is written under a
+    temporary name and then renamed, so that interrupted writes never leave
+    a partial cache entry.
+    '''
+    file = get_cache_file(url)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(f'{file.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, file)
+
+def invalidate_cache(reqs=None):
+    '''
+    Removes cached responses for the requests in reqs, or the whole cache
+    if reqs is None.
+    '''
+    if reqs is None:
+        files = cachePath.glob('*/*.json.gz')
+    else:
+        files = [get_cache_file(value['req']) for year_reqs in reqs.values()
+                 for value in year_reqs.values()]
+    for file in files:
+        file.unlink(missing_ok=True)
+
+def get_response_error(data):
+    '''
+    Returns the error reported in a response body, or None if it holds
+    data: BEA reports errors, e.g. an invalid API key, with status 200 as an
+    Error object, and Census data starts with a header row.
+    '''
+    if isinstance(data, dict) and 'BEAAPI' in data:
+        bea = data['BEAAPI']
+        results = bea.get('Results')
+        error = bea.get('Error') or (results.get('Error')
+                                     if isinstance(results, dict) else None)
+        return error
+    if isinstance(data, list) and data and isinstance(data[0], list):
+        return None
+    return 'unexpected response'
+
+def fetch_json(session, url, limiter, ttl=None, refresh=False):
+    '''
+    Returns the response for a single url from the local cache, or requests
+    it once the host rate limit allows it. Only responses holding data are
+    cached, so that errors are requested again on the next run; HTTP errors
+    raise an HTTPError.
+    '''
+    if not refresh:
+        data = read_cache(url, ttl)
+        if data is not None:
+            return data
+    limiter.wait(url)
+    response = session.get(url)
+    if not response.ok:
+        raise requests.HTTPError(
+            f'{response.status_code} {response.reason} for '
+            f'{normalize_url(url)}: {response.text[:200]}',
+            response=response)
+    data = response.json()
+    error = get_response_error(data)
+    if error is None:
+        write_cache(url, data)
+    else:
+        print(f'Not caching the response for {normalize_url(url)}: {error}')
+    return data
+
+def make_reqs(file, reqs, data_years, workers=8, rate=10, ttl=None,
+              refresh=False):
     '''
     A function to make requests to either the BEA or Census API. Stores all
     responses in a dictionary of the following format:
     d = {year:{year:YYYY, cty:cty, req_url:req_url, data:response}}
+    Requests are issued concurrently by up to `workers` threads sharing one
+    keep-alive session, limited to `rate` requests per second per host.
+    Responses are cached per request, so only requests missing from the
+    cache (or older than ttl seconds) are sent; refresh=True ignores the
+    cache.
     '''
     d={}
-    for year in data_years:
-        year_reqs = reqs[year]
-        d[year] = {}
-        for key, value in year_reqs.items():
-            response = requests.get(value['req'])
-            value['data'] = response.json()
-            d[year][key] = value
+    limiter = RateLimiter(rate)
+    with get_session(workers) as session, \
+         ThreadPoolExecutor(max_workers=workers) as pool:
+        for year in data_years:
+            year_reqs = reqs[year]
+            d[year] = {}
+            futures = {key: pool.submit(fetch_json, session, value['req'],
+                                        limiter, ttl, refresh)
+                       for key, value in year_reqs.items()}
+            for key, value in year_reqs.items():
+                value['data'] = futures[key].result()
+                d[year][key] = value
     print('Successfully Collected All',file,'Requests')
     return d
 
 def get_census_df(d, c_d, data_years):
     '''
-    Creates a dataframe for Census response data for a given year.
+    Creates a dataframe for Census response data for a given year. Records
+    for all countries are collected into flat arrays and pivoted once.
     '''
-    df = pd.DataFrame()
     country_code = {v:k for k,v in c_d.items()}
+    countries = []
+    years, ctys, naics, values = [], [], [], []
     for year in data_years:
         for k, v in d[year].items():
             v_d = v['data']
             cty = country_code.get(v['cty'])
-            value_df = pd.DataFrame(data=v_d[1:], columns=v_d[0])
-            cols = value_df[['NAICS','GEN_CIF_YR']]
-            cols = (cols
-                    .assign(GEN_CIF_YR = lambda x: (x['GEN_CIF_YR']
-                                                    .astype(float)
-                                                    ))
-                    .rename(columns={'GEN_CIF_YR':cty})
-                    .set_index('NAICS')
-                    )
-            df = pd.concat([df, cols], axis=1)
-        df = df.assign(Year=year)
+            countries.append(cty)
+            i_n = v_d[0].index('NAICS')
+            i_v = v_d[0].index('GEN_CIF_YR')
+            rows = v_d[1:]
+            naics.extend(r[i_n] for r in rows)
+            values.extend(r[i_v] for r in rows)
+            ctys.extend([cty] * len(rows))
+            years.extend([year] * len(rows))
+    df = (pd.DataFrame({'NAICS': naics,
+                        'Year': years,
+                        'CountryCode': ctys,
+                        'Import Quantity': np.asarray(values, dtype=float)})
+            .pivot_table(index=['NAICS', 'Year'], columns='CountryCode',
+                         values='Import Quantity', aggfunc='sum',
+                         fill_value=0)
+            .reindex(columns=list(dict.fromkeys(countries)), fill_value=0)
+            .rename_axis(columns=None)
+            )
     df = df.replace(np.nan, 0).reset_index()
     ## Merge in BEA Codes and flatten
     c_b = pd.read_csv(apiPath / 'Census_API_Mappings.csv')
     df = df.merge(c_b, how='left', on='NAICS')
     df = (df.drop(columns='NAICS')
-            .groupby(['BEA Sector', 'Year']).agg(sum)
+            .groupby(['BEA Sector', 'Year']).agg('sum')
             .reset_index()
             .melt(id_vars=['BEA Sector', 'Year'], var_name='CountryCode',
                   value_name='Import Quantity')
@@ -176,69 +342,58 @@ def get_census_df(d, c_d, data_years):
 
 def get_bea_df(d, b_d, data_years):
     '''
-    Creates a dataframe for BEA response data for a given year.
+    Creates a dataframe for BEA response data for the given years. Service
+    types and values for all years and countries are extracted into flat
+    arrays, converted and scaled in one step, and aligned to BEA sectors
+    with a single reindex.
     '''
     e_t_d = {v:k for k,v in b_d.items()}
-    n_d = {}
-    df_all = pd.DataFrame()
     b_b = (pd.read_csv(apiPath / 'BEA_API_Mappings.csv')
            .filter(['API BEA Service', 'BEA Sector'])
            .rename(columns={'API BEA Service': 'BEA Service'})
            )
+    if b_b['BEA Sector'].duplicated().any():
+        raise ValueError("Duplicate BEA sectors")
+    keys = []
+    cols, services, values = [], [], []
     for year in data_years:
         for k, v in d[year].items():
-            cty = v['cty']
-            cty = e_t_d[cty]
-            d_n = {}
+            keys.append((year, e_t_d[v['cty']]))
             data = v['data']['BEAAPI']['Results']['Data']
-            for item in data:
-                sector = item['TypeOfService']
-                value = item['DataValue']
-                d_n[sector] = value
-            n_d[cty] = d_n
-        df = (pd.DataFrame(n_d)
-              .apply(pd.to_numeric)
-              .dropna(how='all')
-              .replace(np.nan,0)
-              .reset_index()
-              .rename(columns={'index':'BEA Service'})
-              )
-        ## Merge in BEA codes and flatten
-        df = (df.merge(b_b, how='right', on='BEA Service', validate='1:m')
-              .fillna(0)
-              .drop(columns='BEA Service')
-              )
-        if(len(df['BEA Sector'].unique()) != len(df)):
-            raise ValueError("Duplicate BEA sectors")
-        df = (df.melt(id_vars=['BEA Sector'],
-                      var_name='CountryCode',
-                      value_name='Import Quantity')
-                .assign(Unit='USD')
-                .assign(Source='BEA')
-                .assign(Year=year)
-                )
-        df['Import Quantity'] = df['Import Quantity'].apply(lambda x: x*1000000)
-        df_all = pd.concat([df_all, df], ignore_index=True)
+            cols.extend([len(keys) - 1] * len(data))
+            services.extend(item['TypeOfService'] for item in data)
+            values.extend(item['DataValue'] for item in data)
+    s = pd.Series(pd.to_numeric(np.asarray(values, dtype=object)),
+                  index=pd.MultiIndex.from_arrays([services, cols]),
+                  dtype=float)
+    s = s[~s.index.duplicated(keep='last')]
+    ## Align to BEA codes and flatten
+    wide = (s.unstack() if len(s) else pd.DataFrame())
+    wide = (wide.reindex(index=b_b['BEA Service'], columns=range(len(keys)))
+                .fillna(0)
+                .to_numpy())
+    n = len(b_b)
+    df_all = pd.DataFrame({
+        'BEA Sector': np.tile(b_b['BEA Sector'].to_numpy(), len(keys)),
+        'CountryCode': np.repeat([cty for year, cty in keys], n),
+        'Import Quantity': wide.ravel(order='F') * 1000000,
+        'Unit': 'USD',
+        'Source': 'BEA',
+        'Year': np.repeat([year for year, cty in keys], n),
+        })
     return df_all
 
-def get_imports_data(year):
+def get_imports_data(year, ttl=None, refresh=False):
     '''
-    A function to call from other scripts.
+    A function to call from other scripts. API responses are served from
+    the local response cache where available.
     '''
     b_d, c_d = get_country_schema()
     year = str(year)
-    try:
-        c_responses = pkl.load(open(dataPath / f'census_responses_{year}.pkl', 'rb'))
-        b_responses = pkl.load(open(dataPath / f'bea_responses_{year}.pkl', 'rb'))
-    except FileNotFoundError:
-        print('Responses not found locally, querying API')
-        dataPath.mkdir(exist_ok=True)
-        b_reqs = create_Reqs('BEA_API', b_d, year)
-        c_reqs = create_Reqs('Census_API', c_d, year)
-        b_responses = make_reqs('BEA', b_reqs, [year])
-        pkl.dump(b_responses, open(dataPath / f'bea_responses_{year}.pkl', 'wb'))
-        c_responses = make_reqs('Census', c_reqs, [year])
-        pkl.dump(c_responses, open(dataPath / f'census_responses_{year}.pkl', 'wb'))
+    b_reqs = create_Reqs('BEA_API', b_d, year)
+    c_reqs = create_Reqs('Census_API', c_d, year)
+    b_responses = make_reqs('BEA', b_reqs, [year], ttl=ttl, refresh=refresh)
+    c_responses = make_reqs('Census', c_reqs, [year], ttl=ttl, refresh=refresh)
 
     b_df = get_bea_df(b_responses, b_d, [year])
     c_df = get_census_df(c_responses, c_d, [year])
@@ -246,5 +401,39 @@ def get_imports_data(year):
     i_df['Country'] = i_df['CountryCode'].map(b_d)
     return i_df
 
+def fetch_imports_data(year):
+    '''
+    Requests the BEA and Census responses of a year that are missing from
+    the response cache, without reading the cached ones, e.g. so that the
+    files listed by get_imports_data_files exist.
+    '''
+    b_d, c_d = get_country_schema()
+    year = str(year)
+    for file, name, d in (('BEA_API', 'BEA', b_d),
+                          ('Census_API', 'Census', c_d)):
+        reqs = create_Reqs(file, d, year)
+        missing = {key: value for key, value in reqs[year].items()
+                   if read_cache(value['req']) is None}
+        if missing:
+            make_reqs(name, {year: missing}, [year])
+
+def get_imports_data_files(year):
+    '''
+    Returns the files get_imports_data reads for a year: the API definitions
+    and mappings, the country concordances and the cached responses of its
+    requests, e.g. to tell whether its result can have changed. Responses
+    missing from the cache are listed too, see fetch_imports_data.
+    '''
+    b_d, c_d = get_country_schema()
+    files = [apiPath / 'BEA_API.yml', apiPath / 'Census_API.yml',
+             apiPath / 'BEA_API_Mappings.csv',
+             apiPath / 'Census_API_Mappings.csv',
+             conPath / 'country.txt', conPath / 'exio_tiva_concordance.csv']
+    for file, d in (('BEA_API', b_d), ('Census_API', c_d)):
+        reqs = create_Reqs(file, d, year)
+        files.extend(get_cache_file(value['req'])
+                     for value in reqs[str(year)].values())
+    return files
+
 if __name__ == '__main__':
     id_f = get_imports_data(year=2018)
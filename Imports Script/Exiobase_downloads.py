@@ -1,4 +1,12 @@
+import hashlib
+import json
+import os
 import pymrio
+import re
+import traceback
+import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 import pickle as pkl
 
@@ -7,26 +15,246 @@ model_Path = Path(__file__).parent / 'mrio_models'
 resource_Path = Path(__file__).parent / 'processed_mrio_resources'
 model_type = 'pxp' #model type
 
-def process_exiobase(year_start=2012, year_end=2022, download=False):
+with open(Path(__file__).parent / 'Data' / 'exio_config.yml', 'r') as file:
+    config = yaml.safe_load(file)
+
+
+def process_exiobase(year_start=2012, year_end=2022, download=False,
+                     extract=False, workers=1, year_memory_gb=8):
+    '''
+    Parses the Exiobase model for each year and stores the resources used
+    downstream. By default the full M matrix and trade frames are pickled;
+    with extract=True only the flows selected in exio_config.yml (see
+    select_flows) and the US bilateral trade column are written to a slim
+    parquet file (requires pyarrow).
+    When workers > 1, years are parsed in a process pool whose size is also
+    limited by available memory, assuming year_memory_gb per parsed year.
+    Failures for individual years are collected and reported at the end;
+    returns a dict of {year: error message} for years that failed.
+    '''
     years = list(range(year_start, year_end+1))
+    if extract:
+        import_pyarrow()
+        # ^^ fail before downloading and parsing the models
     if download == True:
         print('Downloading exiobase files')
         pymrio.download_exiobase3(storage_folder=model_Path,
                                   system=model_type,
                                   years=years)
     resource_Path.mkdir(exist_ok=True)
-    for y in years:
-        print(f'Processing exiobase files for {y}')
-        file = model_Path / f'IOT_{y}_{model_type}.zip'
-        e = pymrio.parse_exiobase3(file)
-        trade = pymrio.IOSystem.get_gross_trade(e)
-        d = {}
-        d['M'] = e.impacts.M
-        d['Trade Total'] = trade[1]
-        # ^^ df with gross total imports and exports per sector and region
-        d['Bilateral Trade'] = trade[0]
-        # ^^ df with rows: exporting country and sector, columns: importing countries
-        pkl.dump(d, open(resource_Path / f'exio_all_resources_{y}.pkl', 'wb'))
+    workers = get_max_workers(workers, len(years), year_memory_gb)
+    failures = {}
+    if workers <= 1:
+        for y in years:
+            try:
+                process_exiobase_year(y, extract)
+            except Exception:
+                failures[y] = traceback.format_exc()
+                print(f'ERROR: processing exiobase files for {y} failed')
+    else:
+        print(f'Processing {len(years)} years with {workers} workers')
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_exiobase_year, y, extract): y
+                       for y in years}
+            for f in as_completed(futures):
+                y = futures[f]
+                try:
+                    f.result()
+                except Exception:
+                    failures[y] = traceback.format_exc()
+                    print(f'ERROR: processing exiobase files for {y} failed')
+    for y, err in sorted(failures.items()):
+        print(f'--- {y} ---\n{err}')
+    return failures
+
+
+def process_exiobase_year(y, extract=False):
+    '''
+    Parses and stores the Exiobase model for a single year.
+    '''
+    print(f'Processing exiobase files for {y}')
+    file = model_Path / f'IOT_{y}_{model_type}.zip'
+    e = pymrio.parse_exiobase3(file)
+    M = getattr(e, get_account()).M
+    trade = pymrio.IOSystem.get_gross_trade(e)
+    if extract:
+        store_exiobase_extract(M, trade[0], y)
+        return
+    d = {}
+    d['M'] = M
+    d['Account'] = get_account()
+    d['Trade Total'] = trade[1]
+    # ^^ df with gross total imports and exports per sector and region
+    d['Bilateral Trade'] = trade[0]
+    # ^^ df with rows: exporting country and sector, columns: importing countries
+    with open(resource_Path / f'exio_all_resources_{y}.pkl', 'wb') as f:
+        pkl.dump(d, f)
+
+
+def get_max_workers(workers, n_years, year_memory_gb):
+    '''
+    Bounds the requested number of workers by the number of years, the cpu
+    count and the memory currently available, so that concurrent parsing
+    does not exhaust RAM. When the available memory cannot be determined,
+    years are parsed one at a time.
+    '''
+    limit = min(workers, n_years, os.cpu_count() or 1)
+    available = get_available_memory()
+    if available is None:
+        if limit > 1:
+            print('WARNING: available memory unknown, using a single worker')
+        return 1
+    return max(1, min(limit, int(available // (year_memory_gb * 1024**3))))
+
+
+def get_available_memory():
+    '''
+    Returns the memory in bytes available to new processes, including
+    reclaimable page cache, from psutil if installed or else from
+    /proc/meminfo (Linux). Returns None if neither is available.
+    '''
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def store_exiobase_extract(M, bilateral_trade, year, chunk_size=100):
+    '''
+    Writes the slices of the Exiobase model used to generate import factors:
+    the selected flow rows of M and the US column of bilateral trade, one
+    row per exporting region and sector. The flow rows are copied out of M
+    chunk_size at a time, straight into the columns of the parquet table, so
+    that memory stays bounded by the extract plus one chunk however many
+    flows are selected. The fingerprint of the selection is stored in the
+    file's metadata, see is_current_extract.
+    '''
+    pa, pq = import_pyarrow()
+
+    flows = list(select_flows(M.index))
+    names = list(config['fields'].keys())
+    arrays = [pa.array(M.columns.get_level_values(i).astype(str))
+              for i in range(len(names))]
+    for start in range(0, len(flows), chunk_size):
+        chunk = flows[start:start + chunk_size]
+        arrays.extend(pa.array(row) for row in M.loc[chunk].to_numpy(float))
+        names.extend(str(f) for f in chunk)
+    arrays.append(pa.array(bilateral_trade['US'].reindex(M.columns)
+                           .to_numpy(float)))
+    names.append('US')
+    table = pa.Table.from_arrays(
+        arrays, names=names,
+        metadata={'exio_selection': get_selection_fingerprint()})
+    pq.write_table(table, resource_Path / f'exio_extract_{year}.parquet')
+
+
+def import_pyarrow():
+    '''
+    Returns the pyarrow and pyarrow.parquet modules needed to write
+    extracts, raising an ImportError that says so if pyarrow is missing.
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('Writing Exiobase extracts (extract=True) '
+                          'requires pyarrow; install it or process the '
+                          'years without extract') from e
+    return pa, pq
+
+
+def is_current_extract(path):
+    '''
+    Returns whether the extract at path exists, can be read and was
+    written for the account and flow selection currently in
+    exio_config.yml.
+    '''
+    if not path.exists():
+        return False
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+    # ^^ without pyarrow an extract cannot be read; the pickle is used
+    metadata = pq.read_schema(path).metadata or {}
+    return (metadata.get(b'exio_selection')
+            == get_selection_fingerprint().encode())
+
+
+def get_account():
+    '''
+    Returns the Exiobase extension the flows are taken from.
+    '''
+    return config.get('account', 'impacts')
+
+
+def get_selection_fingerprint():
+    '''
+    Returns a fingerprint of the account and flow selection in
+    exio_config.yml.
+    '''
+    selection = {'account': get_account(),
+                 **{k: config.get(k) for k in
+                    ('flows', 'flow_groups', 'flow_selection')}}
+    return hashlib.sha256(
+        json.dumps(selection, sort_keys=True).encode()).hexdigest()
+
+
+def select_flows(names):
+    '''
+    Returns the flows selected in exio_config.yml among the Exiobase
+    stressor names, in their order, mapped to the names used downstream:
+    flows listed under flows are renamed, flows matched by an entry of
+    flow_selection keep their Exiobase name.
+    '''
+    patterns = get_flow_patterns()
+    selected = {}
+    for name in names:
+        if name in config['flows']:
+            selected[name] = config['flows'][name]
+        elif any(p.search(str(name)) for p, _ in patterns):
+            selected[name] = name
+    return selected
+
+
+@lru_cache(maxsize=None)
+def get_flow_patterns():
+    '''
+    Returns the compiled regular expressions of flow_selection in
+    exio_config.yml, each with the context and unit of the flows it
+    matches. Entries name a group of flow_groups or are a pattern
+    themselves, taking the default context and unit.
+    '''
+    groups = config.get('flow_groups') or {}
+    patterns = []
+    for entry in config.get('flow_selection') or []:
+        group = groups.get(entry, {'patterns': [entry]})
+        properties = (group.get('context', 'emission/air'),
+                      group.get('unit', 'kg'))
+        patterns.extend((re.compile(p), properties)
+                        for p in group['patterns'])
+    return tuple(patterns)
+
+
+def get_flow_properties(flow):
+    '''
+    Returns the context and unit of a selected flow, by its downstream name.
+    '''
+    if flow not in config['flows'].values():
+        for pattern, properties in get_flow_patterns():
+            if pattern.search(flow):
+                return properties
+    return ('emission/air', 'kg')
+
 
 if __name__ == '__main__':
     process_exiobase(year_start = 2019, year_end=2019, download=False)
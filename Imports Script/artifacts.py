@@ -0,0 +1,160 @@
+'''
+Artifact cache for the stages of the imports pipeline. A stage stores its
+result under a fingerprint of its arguments, of the files it reads and of
+its code, so that a rerun recomputes only the stages whose inputs changed.
+Stages receive the results of upstream stages as arguments and fingerprint
+them by content: a changed result invalidates the stages downstream, while
+a result that is recomputed unchanged leaves them cached.
+'''
+import functools
+import hashlib
+import inspect
+import os
+import pickle as pkl
+from pathlib import Path
+
+import pandas as pd
+
+artifactPath = Path(__file__).parent / 'processed_artifacts'
+
+settings = {'enabled': True}
+# ^^ set per process, see useeio_imports_script._init_worker
+
+_digests = {}
+
+
+def stage(files=None, code=(), prepare=None):
+    '''
+    Decorator caching the results of a pipeline stage. files is called with
+    the arguments of the stage and returns what it reads besides them,
+    e.g. paths, which count by the content of the file. code names the
+    functions the stage calls; their source counts with its own, or their
+    whole module for functions of other modules. prepare is called with
+    the arguments before the fingerprint is computed, to create the files
+    the stage would otherwise create while running, e.g. by downloading
+    them. If a file is still missing, the stage runs uncached.
+    '''
+    def wrap(f):
+        signature = inspect.signature(f)
+
+        @functools.wraps(f)
+        def cached(*args, **kwargs):
+            if not settings['enabled']:
+                return f(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if prepare:
+                prepare(**bound.arguments)
+            try:
+                inputs = files(**bound.arguments) if files else ()
+                key = fingerprint(get_code_version(f, tuple(code)),
+                                  bound.arguments, inputs)
+            except FileNotFoundError as e:
+                print(f'Not caching {f.__name__}, input missing: '
+                      f'{e.filename}')
+                return f(*args, **kwargs)
+            file = artifactPath / f.__name__ / f'{key}.pkl'
+            try:
+                with open(file, 'rb') as fp:
+                    result = pkl.load(fp)
+                print(f'Reusing cached {f.__name__}')
+                return result
+            except (FileNotFoundError, EOFError, pkl.UnpicklingError):
+                pass
+            result = f(*args, **kwargs)
+            write_artifact(file, result)
+            return result
+        return cached
+    return wrap
+
+
+def fingerprint(*parts):
+    '''
+    Returns a sha256 hex digest of parts: data frames and series by content,
+    paths by the content of the file, containers item by item and anything
+    else by its repr.
+    '''
+    h = hashlib.sha256()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+def _update(h, part):
+    if isinstance(part, dict):
+        _update(h, ('dict', *sorted(part.items(), key=lambda x: repr(x[0]))))
+        return
+    if isinstance(part, (list, tuple)):
+        h.update(f'{type(part).__name__}:{len(part)};'.encode())
+        for p in part:
+            _update(h, p)
+        return
+    if isinstance(part, (pd.DataFrame, pd.Series)):
+        frame = part.to_frame() if isinstance(part, pd.Series) else part
+        data = (repr((type(part).__name__, list(frame.columns),
+                      [str(t) for t in frame.dtypes], frame.index.names))
+                .encode()
+                + pd.util.hash_pandas_object(part, index=True)
+                    .to_numpy().tobytes())
+    elif isinstance(part, Path):
+        data = f'{part.name}:{get_file_digest(part)}'.encode()
+    else:
+        data = repr(part).encode()
+    h.update(len(data).to_bytes(8, 'little'))
+    h.update(data)
+
+
+def get_file_digest(path):
+    '''
+    Returns the sha256 of a file's content, computed once per process and
+    file version (by size and modification time). Raises
+    FileNotFoundError if the file is missing.
+    '''
+    st = path.stat()
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    if key not in _digests:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _digests[key] = h.hexdigest()
+    return _digests[key]
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version(f, code):
+    '''
+    Returns the fingerprint of the source of a stage and of the functions
+    named in code, see stage.
+    '''
+    module = inspect.getmodule(f)
+    sources = [inspect.getsource(f)]
+    for name in code:
+        obj = f.__globals__[name]
+        if inspect.getmodule(obj) is not module:
+            obj = inspect.getmodule(obj)
+        sources.append(inspect.getsource(obj))
+    return fingerprint(*sources)
+
+
+def write_artifact(file, result):
+    '''
+    Pickles a stage result. The file is written under a temporary name and
+    then renamed, so that concurrent or interrupted runs never leave a
+    partial artifact.
+    '''
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(f'{file.name}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        pkl.dump(result, f, protocol=pkl.HIGHEST_PROTOCOL)
+    os.replace(tmp, file)
+
+
+def clear(name=None):
+    '''
+    Removes the artifacts of the named stage, or of all stages if name is
+    None.
+    '''
+    pattern = f'{name}/*.pkl' if name else '*/*.pkl'
+    for file in artifactPath.glob(pattern):
+        file.unlink(missing_ok=True)
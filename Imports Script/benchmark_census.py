@@ -0,0 +1,107 @@
+'''
+Benchmark of get_census_df, which builds the Census imports frame from the
+API responses, against its earlier version, which built a frame per country
+and appended it with pd.concat. Both run on the same synthetic responses for
+one year, shaped like those of the Census API and covering the NAICS codes
+of Census_API_Mappings.csv; the results are checked for agreement before the
+timings are printed.
+
+    python benchmark_census.py [--countries 250] [--naics 300] [--repeat 5]
+'''
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import API_Imports_Data_Script as a
+
+
+def make_inputs(countries=250, naics=300, year=2020, seed=0):
+    '''
+    Returns synthetic Census responses for a year, keyed by request like
+    those of make_reqs, and the matching country code dictionary. Each
+    country reports a random subset of up to naics of the mapped NAICS
+    codes; a few report none.
+    '''
+    rng = np.random.default_rng(seed)
+    codes = (pd.read_csv(a.apiPath / 'Census_API_Mappings.csv',
+                         dtype={'NAICS': str})['NAICS']
+             .drop_duplicates().tolist())
+    codes = codes[:naics]
+    c_d = {f'C{i:03d}': f'{1000 + i}' for i in range(countries)}
+    responses = {}
+    for i, (cty, cty_code) in enumerate(c_d.items()):
+        n = 0 if i % 50 == 49 else rng.integers(1, len(codes) + 1)
+        rows = [[code, str(round(rng.gamma(1, 1e6))), cty_code]
+                for code in rng.choice(codes, n, replace=False)]
+        responses[cty] = {'cty': cty_code,
+                          'data': [['NAICS', 'GEN_CIF_YR', 'CTY_CODE'],
+                                   *rows]}
+    return {year: responses}, c_d
+
+
+def get_census_df_concat(d, c_d, data_years):
+    '''
+    The earlier version of get_census_df, which concatenates a frame per
+    country. Only the groupby differs: it sums with 'sum' rather than the
+    builtin sum, which pandas deprecates as an aggregation.
+    '''
+    df = pd.DataFrame()
+    country_code = {v:k for k,v in c_d.items()}
+    for year in data_years:
+        for k, v in d[year].items():
+            v_d = v['data']
+            cty = country_code.get(v['cty'])
+            value_df = pd.DataFrame(data=v_d[1:], columns=v_d[0])
+            cols = value_df[['NAICS','GEN_CIF_YR']]
+            cols = (cols
+                    .assign(GEN_CIF_YR = lambda x: (x['GEN_CIF_YR']
+                                                    .astype(float)
+                                                    ))
+                    .rename(columns={'GEN_CIF_YR':cty})
+                    .set_index('NAICS')
+                    )
+            df = pd.concat([df, cols], axis=1)
+        df = df.assign(Year=year)
+    df = df.replace(np.nan, 0).reset_index()
+    c_b = pd.read_csv(a.apiPath / 'Census_API_Mappings.csv')
+    df = df.merge(c_b, how='left', on='NAICS')
+    df = (df.drop(columns='NAICS')
+            .groupby(['BEA Sector', 'Year']).agg('sum')
+            .reset_index()
+            .melt(id_vars=['BEA Sector', 'Year'], var_name='CountryCode',
+                  value_name='Import Quantity')
+            .assign(Unit='USD')
+            .assign(Source='Census')
+            )
+    return df
+
+
+def run(f, inputs, repeat):
+    f(*inputs)  # warm up, e.g. reading the mappings
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = f(*inputs)
+    return result, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare get_census_df with its per-country concat '
+                    'version')
+    parser.add_argument('--countries', type=int, default=250)
+    parser.add_argument('--naics', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+    # ^^ raised by the concat version for its fragmented frame
+    d, c_d = make_inputs(args.countries, args.naics)
+    inputs = (d, c_d, list(d))
+    expected, t_concat = run(get_census_df_concat, inputs, args.repeat)
+    actual, t_flat = run(a.get_census_df, inputs, args.repeat)
+    pd.testing.assert_frame_equal(expected, actual)
+    print(f'concat: {t_concat:.3f} s, one pass: {t_flat:.3f} s, '
+          f'speedup: {t_concat / t_flat:.1f}x (results agree)')
@@ -0,0 +1,93 @@
+'''
+Benchmark of the two engines that weight the Exiobase multipliers and map
+them to BEA sectors, calc_weighted_multipliers (pandas) and
+calc_weighted_multipliers_sparse (sparse matrix products). Both run on the
+same synthetic inputs, shaped like a year of Exiobase and imports data; the
+results are checked for agreement before the timings are printed.
+
+    python benchmark_engines.py [--countries 49] [--sectors 200] [--flows 3]
+                                [--repeat 5]
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import useeio_imports_script as u
+
+
+def make_inputs(countries=49, sectors=200, details=400, n_flows=3, seed=0):
+    '''
+    Returns synthetic contribution coefficients, multipliers, bilateral
+    trade and a sector concordance with the columns used by the engines,
+    for the configured flows followed by synthetic ones up to n_flows.
+    '''
+    rng = np.random.default_rng(seed)
+    flows = list(u.config['flows'].values())
+    flows += [f'Flow {i}' for i in range(n_flows - len(flows))]
+    regions = ['CA', 'CN', 'EU', 'JP', 'MX', 'APAC', 'ROW']
+    country_codes = [f'C{i:02d}' for i in range(countries)]
+    sector_codes = [f'S{i:03d}' for i in range(sectors)]
+    detail_codes = [f'D{i:03d}' for i in range(details)]
+
+    e_u = pd.DataFrame(
+        [(d, s) for d in detail_codes
+         for s in rng.choice(sector_codes, rng.integers(1, 4), replace=False)],
+        columns=['BEA Detail', 'Exiobase Sector'])
+    e_d = pd.DataFrame([(c, s) for c in country_codes for s in sector_codes],
+                       columns=['CountryCode', 'Exiobase Sector'])
+    e_d = pd.concat([e_d, pd.DataFrame(rng.gamma(1, 2, (len(e_d), len(flows))),
+                                       columns=flows)], axis=1)
+    e_d.loc[rng.random(len(e_d)) < 0.02, flows[-1]] = np.nan
+    e_d['Year'] = '2019'
+    trade = rng.gamma(1, 100, len(e_d))
+    trade[rng.random(len(e_d)) < 0.2] = 0
+    e_bil = (e_d[['CountryCode', 'Exiobase Sector']]
+             .assign(**{'Bilateral Trade Total': trade}))
+
+    p_d = pd.DataFrame(
+        [(regions[i % len(regions)], c, f'U{j // 6:02d}', d)
+         for i, c in enumerate(country_codes)
+         for j, d in enumerate(detail_codes) if rng.random() < 0.6],
+        columns=['TiVA Region', 'CountryCode', 'BEA Summary', 'BEA Detail'])
+    p_d['Import Quantity'] = rng.gamma(1, 10, len(p_d))
+    c_d = u.calc_contribution_coefficients.__wrapped__(p_d)
+    # ^^ uncached, see artifacts.stage
+
+    flow_list = pd.DataFrame({'Flowable': flows,
+                              'Context': 'emission/air',
+                              'Flow UUID': [f'uuid-{f}' for f in flows]})
+    return c_d, e_d, e_bil, e_u, flow_list
+
+
+def run(engine, inputs, year, repeat):
+    engine(*inputs, year)  # warm up, e.g. imports
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = engine(*inputs, year)
+    return result, (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the pandas and sparse multiplier engines')
+    parser.add_argument('--countries', type=int, default=49)
+    parser.add_argument('--sectors', type=int, default=200)
+    parser.add_argument('--details', type=int, default=400)
+    parser.add_argument('--flows', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    c_d, e_d, e_bil, e_u, flow_list = make_inputs(
+        args.countries, args.sectors, args.details, args.flows)
+    u.shared['flows'] = flow_list
+    inputs = (c_d, e_d, e_bil, e_u)
+    expected, t_pandas = run(u.calc_weighted_multipliers, inputs, 2019,
+                             args.repeat)
+    actual, t_sparse = run(u.calc_weighted_multipliers_sparse, inputs, 2019,
+                           args.repeat)
+    for a, b in zip(expected, actual):
+        pd.testing.assert_frame_equal(a, b, check_exact=False, rtol=1e-9)
+    print(f'pandas: {t_pandas:.3f} s, sparse: {t_sparse:.3f} s, '
+          f'speedup: {t_pandas / t_sparse:.1f}x (results agree)')
@@ -0,0 +1,164 @@
+'''
+Benchmark of loading a year of stored Exiobase resources for the
+multipliers and the bilateral trade: the earlier version, which unpickled
+exio_all_resources_{year}.pkl once for each of pull_exiobase_multipliers
+and pull_exiobase_bilateral_trade, against load_exiobase_resources, which
+unpickles it once and keeps only the selected flows and the US column.
+The pickle is synthetic, shaped like a year of the Exiobase pxp model with
+rows flows in the configured account. Each version runs in a fresh process
+so that its peak RSS can be measured; the results are checked for agreement
+before the numbers are printed.
+
+    python benchmark_exiobase_load.py [--rows 1113] [--regions 49]
+                                      [--sectors 200]
+'''
+import argparse
+import pickle as pkl
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import Exiobase_downloads as x
+import useeio_imports_script as u
+
+
+def make_resources(rows=1113, regions=49, sectors=200, seed=0):
+    '''
+    Returns synthetic resources in the layout written by
+    process_exiobase_year: M with the configured flows among rows flows,
+    and gross and bilateral trade.
+    '''
+    rng = np.random.default_rng(seed)
+    region_codes = ['US'] + [f'R{i:02d}' for i in range(1, regions)]
+    columns = pd.MultiIndex.from_product(
+        [region_codes, [f'Sector {i}' for i in range(sectors)]],
+        names=list(u.config['fields'].keys()))
+    flows = list(u.config['flows'])
+    flows += [f'Flow {i}' for i in range(rows - len(flows))]
+    M = pd.DataFrame(rng.random((rows, len(columns))),
+                     index=pd.Index(flows, name='stressor'), columns=columns)
+    bilateral_trade = pd.DataFrame(
+        rng.random((len(columns), regions)), index=columns,
+        columns=pd.Index(region_codes, name='region'))
+    trade_total = pd.DataFrame(rng.random((len(columns), 2)), index=columns,
+                               columns=['Gross Exports', 'Gross Imports'])
+    return {'M': M, 'Account': x.get_account(), 'Trade Total': trade_total,
+            'Bilateral Trade': bilateral_trade}
+
+
+def pull_multipliers_baseline(year):
+    '''
+    The earlier version of pull_exiobase_multipliers.
+    '''
+    file = u.resource_Path / f'exio_all_resources_{year}.pkl'
+    exio = pkl.load(open(file,'rb'))
+    M_df = exio['M']
+    fields = {**u.config['fields'], **u.config['flows']}
+    M_df = M_df.loc[M_df.index.isin(fields.keys())]
+    M_df = (M_df
+            .transpose()
+            .reset_index()
+            .rename(columns=fields)
+            .assign(Year=str(year))
+            )
+    return M_df
+
+
+def pull_bilateral_trade_baseline(year):
+    '''
+    The earlier version of pull_exiobase_bilateral_trade.
+    '''
+    file = u.resource_Path / f'exio_all_resources_{year}.pkl'
+    exio = pkl.load(open(file,'rb'))
+    fields = {**u.config['fields'], **u.config['flows']}
+    fields['US'] = 'Bilateral Trade Total'
+    t_df = exio['Bilateral Trade']
+    t_df = (t_df
+            .filter(['US'])
+            .reset_index()
+            .rename(columns=fields)
+            )
+    return t_df
+
+
+def pull_baseline(year):
+    return pull_multipliers_baseline(year), pull_bilateral_trade_baseline(year)
+
+
+def pull_cached(year):
+    return (u.pull_exiobase_multipliers(year),
+            u.pull_exiobase_bilateral_trade(year))
+
+
+VERSIONS = {'baseline': pull_baseline, 'cached': pull_cached}
+
+
+def get_peak_rss():
+    '''
+    Returns the peak RSS of this process in MB, from /proc (Linux): unlike
+    getrusage, which a child inherits from its parent at fork, it counts
+    from the start of the program.
+    '''
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+
+def measure(version, folder, year):
+    '''
+    Prints the load time and the peak RSS above the process's peak before
+    the load, in MB.
+    '''
+    u.resource_Path = x.resource_Path = Path(folder)
+    before = get_peak_rss()
+    start = time.perf_counter()
+    VERSIONS[version](year)
+    elapsed = time.perf_counter() - start
+    print(f'{elapsed:.3f} {get_peak_rss() - before:.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare loading the Exiobase resources twice with '
+                    'load_exiobase_resources')
+    parser.add_argument('--rows', type=int, default=1113)
+    parser.add_argument('--regions', type=int, default=49)
+    parser.add_argument('--sectors', type=int, default=200)
+    parser.add_argument('--measure', choices=list(VERSIONS),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--folder', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    year = 2019
+
+    if args.measure:
+        measure(args.measure, args.folder, year)
+        sys.exit()
+
+    with tempfile.TemporaryDirectory() as folder:
+        resources = make_resources(args.rows, args.regions, args.sectors)
+        file = Path(folder) / f'exio_all_resources_{year}.pkl'
+        with open(file, 'wb') as f:
+            pkl.dump(resources, f)
+        del resources
+        size = file.stat().st_size / 1e6
+
+        u.resource_Path = x.resource_Path = Path(folder)
+        for expected, actual in zip(pull_baseline(year), pull_cached(year)):
+            pd.testing.assert_frame_equal(expected, actual)
+
+        results = {}
+        for version in VERSIONS:
+            out = subprocess.run(
+                [sys.executable, __file__, '--measure', version,
+                 '--folder', folder], check=True, capture_output=True,
+                text=True).stdout.split()
+            results[version] = float(out[-2]), float(out[-1])
+    print(f'pickle: {size:.0f} MB (results agree)')
+    for version, (elapsed, peak) in results.items():
+        print(f'{version}: {elapsed:.3f} s, peak RSS +{peak:.0f} MB')
@@ -0,0 +1,110 @@
+'''
+Registry of the concordances used by the imports pipeline. Each concordance
+is read and reshaped once per process. With pandas' copy-on-write (the
+default from pandas 3) callers receive shallow copies that share the stored
+data, and any change to them, in place or not, copies the data first;
+without it they receive deep copies. Either way callers never alter the
+registry entry.
+'''
+import pandas as pd
+from pathlib import Path
+
+conPath = Path(__file__).parent / 'Concordances'
+
+_loaders = {}
+_registry = {}
+
+_copy_on_write = (int(pd.__version__.split('.')[0]) >= 3
+                  or getattr(pd.options.mode, 'copy_on_write', False) is True)
+
+
+def register(name):
+    '''
+    Decorator registering a function that loads the named concordance.
+    '''
+    def wrap(f):
+        _loaders[name] = f
+        return f
+    return wrap
+
+
+def get_concordance(name):
+    '''
+    Returns a copy of the named concordance that callers may modify,
+    loading it on first use.
+    '''
+    if name not in _registry:
+        _registry[name] = _loaders[name]().reset_index(drop=True)
+    return _registry[name].copy(deep=not _copy_on_write)
+
+
+def load_all():
+    '''
+    Loads every registered concordance, e.g. when initializing a worker
+    process.
+    '''
+    for name in _loaders:
+        get_concordance(name)
+
+
+@register('exio_to_useeio')
+def _exio_to_useeio():
+    '''
+    Opens Exiobase to USEEIO binary concordance.
+    Transforms wide-form Exiobase to USEEIO concordance into long form,
+    extracts all mappings to create new, two column concordance consisting of
+    USEEIO detail and mappings to Exiobase.
+    modified slightly from: https://ntnu.app.box.com/v/EXIOBASEconcordances/file/983477211189
+    '''
+    path = conPath / "exio_to_bea_commodity_concordance.csv"
+    e_u_b = (pd.read_csv(path, dtype=str)
+               .rename(columns={'Unnamed: 0':'BEA Detail'}))
+    e_u_b = e_u_b.iloc[:,:-4]
+    e_u_l = pd.melt(e_u_b, id_vars=['BEA Detail'], var_name='Exiobase Sector')
+    e_u = (e_u_l.query('value == "1"')
+                .reset_index(drop=True))
+    e_u = (e_u[['BEA Detail','Exiobase Sector']])
+    return e_u
+
+
+@register('detail_to_summary')
+def _detail_to_summary():
+    '''
+    Opens crosswalk between BEA (summary & detail) and USEEIO (with and
+    without waste disaggregation) sectors. USEEIO Detail with Waste Disagg
+    and corresponding summary-level codes.
+    '''
+    path = conPath / 'useeio_internal_concordance.csv'
+    u_cc = (pd.read_csv(path, dtype=str,
+                        usecols=['BEA_Detail_Waste_Disagg', 'BEA_Summary'])
+              .rename(columns={'BEA_Detail_Waste_Disagg': 'BEA Detail',
+                               'BEA_Summary': 'BEA Summary'})
+              )
+    u_c = u_cc[['BEA Detail','BEA Summary']]
+    u_c = u_c.drop_duplicates()
+    return u_c
+
+
+@register('tiva_to_exio')
+def _tiva_to_exio():
+    '''
+    Opens concordance dataframe of TiVA regions to exiobase countries.
+    '''
+    path = conPath / 'exio_tiva_concordance.csv'
+    t_e = (pd.read_csv(path, dtype=str,
+                       usecols=['ISO 3166-alpha-2', 'TiVA Region'])
+             .rename(columns={'ISO 3166-alpha-2': 'CountryCode'}))
+    t_e = t_e[["TiVA Region","CountryCode"]]
+    return t_e
+
+
+@register('bea_imports_to_summary')
+def _bea_imports_to_summary():
+    '''
+    Opens mapping of BEA import codes, which are between detail and summary,
+    to BEA summary codes.
+    '''
+    path = conPath / 'bea_imports_corr.csv'
+    corr = (pd.read_csv(path, usecols=['BEA Imports', 'BEA Summary'])
+            .drop_duplicates())
+    return corr
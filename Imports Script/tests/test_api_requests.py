@@ -0,0 +1,206 @@
+'''
+Tests of the API requests of API_Imports_Data_Script against a local stub
+server: concurrent requests, retries of failed and throttled requests, the
+per-host rate limit and the response cache.
+'''
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import API_Imports_Data_Script as api
+
+
+class StubServer(ThreadingHTTPServer):
+    '''
+    Answers GET requests with a json echo of the path. failures maps a path
+    to the status codes returned for its first requests, bodies to a fixed
+    status and body; delay is the time each request is held open.
+    '''
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.failures = {}
+        self.bodies = {}
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic()))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            statuses = server.failures.get(self.path, [])
+            status = statuses.pop(0) if statuses else 200
+        time.sleep(server.delay)
+        body = json.dumps([['path', 'status'],
+                           [self.path, str(status)]]).encode()
+        if self.path in server.bodies:
+            status, body = server.bodies[self.path]
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, 'cachePath', tmp_path / 'cache')
+    return tmp_path / 'cache'
+
+
+def make_test_reqs(server, n, year='2020'):
+    '''
+    Returns requests in the structure of create_Reqs for n countries.
+    '''
+    return {year: {f'{year}_{i}': {'year': year, 'cty': str(i),
+                                   'req': f'{server.url}/data?cty={i}'}
+                   for i in range(n)}}
+
+
+def paths(server):
+    return sorted(path for path, _ in server.requests)
+
+
+def test_requests_are_concurrent(server):
+    server.delay = 0.2
+    reqs = make_test_reqs(server, 8)
+    start = time.monotonic()
+    d = api.make_reqs('Census', reqs, ['2020'], workers=8, rate=None)
+    elapsed = time.monotonic() - start
+    assert server.max_active > 1
+    assert elapsed < 8 * server.delay
+    assert len(server.requests) == 8
+    for key, value in d['2020'].items():
+        assert value['data'][1][0] == f'/data?cty={value["cty"]}'
+
+
+@pytest.mark.parametrize('status', [503, 429])
+def test_failed_requests_are_retried(server, status):
+    reqs = make_test_reqs(server, 3)
+    server.failures['/data?cty=1'] = [status, status]
+    d = api.make_reqs('Census', reqs, ['2020'], workers=3, rate=None)
+    assert paths(server).count('/data?cty=1') == 3
+    assert d['2020']['2020_1']['data'][1] == ['/data?cty=1', '200']
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = api.RateLimiter(rate=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait('http://a.test/x')
+    assert time.monotonic() - start >= 4 / 20 - 0.01
+    start = time.monotonic()
+    limiter.wait('http://b.test/x')
+    assert time.monotonic() - start < 1 / 20
+
+
+def test_make_reqs_respects_rate(server):
+    reqs = make_test_reqs(server, 6)
+    api.make_reqs('Census', reqs, ['2020'], workers=6, rate=10)
+    times = sorted(t for _, t in server.requests)
+    assert len(times) == 6
+    assert times[-1] - times[0] >= 5 / 10 - 0.05
+
+
+def test_second_call_is_served_from_cache(server, cache):
+    reqs = make_test_reqs(server, 4)
+    first = api.make_reqs('Census', reqs, ['2020'], workers=4, rate=None)
+    assert len(server.requests) == 4
+    assert len(list(cache.glob('*/*.json.gz'))) == 4
+    second = api.make_reqs('Census', make_test_reqs(server, 4), ['2020'],
+                           workers=4, rate=None)
+    assert len(server.requests) == 4
+    assert second == first
+    api.make_reqs('Census', make_test_reqs(server, 4), ['2020'],
+                  workers=4, rate=None, refresh=True)
+    assert len(server.requests) == 8
+
+
+def test_cache_ignores_the_api_key(server):
+    url = f'{server.url}/data?cty=1'
+    api.write_cache(f'{url}&UserID=secret', [['cached']])
+    assert api.read_cache(url) == [['cached']]
+    assert api.read_cache(url, ttl=-1) is None
+
+
+def test_error_responses_are_not_cached(server, cache):
+    reqs = make_test_reqs(server, 2)
+    error = {'BEAAPI': {'Results': {'Error': {'APIErrorCode': '3'}}}}
+    server.bodies['/data?cty=0'] = (200, json.dumps(error).encode())
+    server.bodies['/data?cty=1'] = (200, json.dumps({'BEAAPI': {
+        'Error': {'APIErrorDescription': 'Invalid UserID'}}}).encode())
+    d = api.make_reqs('BEA', reqs, ['2020'], workers=2, rate=None)
+    assert d['2020']['2020_0']['data'] == error
+    assert not list(cache.glob('*/*.json.gz'))
+    del server.bodies['/data?cty=0'], server.bodies['/data?cty=1']
+    api.make_reqs('BEA', make_test_reqs(server, 2), ['2020'], workers=2,
+                  rate=None)
+    assert len(server.requests) == 4
+    assert len(list(cache.glob('*/*.json.gz'))) == 2
+
+
+def test_cached_errors_are_requested_again(server):
+    url = f'{server.url}/data?cty=0'
+    api.write_cache(url, {'BEAAPI': {'Error': {'APIErrorCode': '3'}}})
+    assert api.read_cache(url) is None
+    api.make_reqs('BEA', make_test_reqs(server, 1), ['2020'], workers=1,
+                  rate=None)
+    assert len(server.requests) == 1
+    assert api.read_cache(url) == [['path', 'status'],
+                                   ['/data?cty=0', '200']]
+
+
+def test_http_errors_raise(server):
+    server.bodies['/data?cty=0'] = (404, b'<html>Not Found</html>')
+    with pytest.raises(api.requests.HTTPError, match='404'):
+        api.make_reqs('Census', make_test_reqs(server, 1), ['2020'],
+                      workers=1, rate=None)
+
+
+@pytest.mark.parametrize('content', [b'not gzip', b'\x1f\x8b\x08\x00',
+                                     gzip.compress(b'\xff\xfe[')])
+def test_corrupt_cache_entries_are_requested_again(server, content):
+    url = f'{server.url}/data?cty=0'
+    file = api.get_cache_file(url)
+    file.parent.mkdir(parents=True)
+    file.write_bytes(content)
+    assert api.read_cache(url) is None
+    api.make_reqs('Census', make_test_reqs(server, 1), ['2020'], workers=1,
+                  rate=None)
+    assert len(server.requests) == 1
+    assert api.read_cache(url) == [['path', 'status'],
+                                   ['/data?cty=0', '200']]
@@ -1,16 +1,27 @@
+import argparse
+import hashlib
+import numpy as np
+import os
 import pandas as pd
 import pickle as pkl
 import yaml
 import statistics
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from currency_converter import CurrencyConverter
 from datetime import date
+from functools import lru_cache
 from pathlib import Path
 
 import fedelemflowlist as fedelem
-from esupy.dqi import get_weighted_average
 
-from API_Imports_Data_Script import get_imports_data
-from Exiobase_downloads import process_exiobase
+import artifacts
+from API_Imports_Data_Script import (fetch_imports_data, get_imports_data,
+                                     get_imports_data_files)
+from concordances import get_concordance, load_all
+from Exiobase_downloads import (get_account, get_flow_properties,
+                                is_current_extract, model_Path, model_type,
+                                process_exiobase, select_flows)
 #%%
 ''' 
 VARIABLES:
@@ -39,6 +50,7 @@ dataPath = Path(__file__).parent / 'Data'
 conPath = Path(__file__).parent / 'Concordances'
 resource_Path = Path(__file__).parent / 'processed_mrio_resources'
 out_Path = Path(__file__).parent / 'output'
+tivaPath = Path(__file__).parent / 'processed_tiva_resources'
 
 flow_cols = ('Flow', 'Compartment', 'Unit',
              'CurrencyYear', 'EmissionYear', 'PriceType',
@@ -49,123 +61,121 @@ flow_cols = ('Flow', 'Compartment', 'Unit',
 with open(dataPath.parent / "Data" / "exio_config.yml", "r") as file:
     config = yaml.safe_load(file)
 
+shared = {}
+# ^^ concordances and reference data loaded once per process, see _init_worker
 
-def generate_exio_factors(year_start, year_end, io_level='Summary'):
+
+def generate_exio_factors(year_start, year_end, io_level='Summary',
+                          workers=1, engine='pandas', cache=True):
     '''
-    Runs through script to produce emission factors for U.S. imports from exiobase
+    Runs through script to produce emission factors for U.S. imports from exiobase.
+    When workers > 1, years are processed concurrently in a process pool.
+    In either mode, failures for individual years are collected and
+    reported at the end rather than aborting the batch. Returns a dict of {year: error message}
+    for years that failed. engine selects how the Exiobase multipliers are
+    weighted and mapped to BEA sectors, see calc_weighted_multipliers.
+    With cache=True the results of the pipeline stages are reused from
+    earlier runs as long as their inputs are unchanged, see artifacts.py.
     '''
     years = list(range(year_start, year_end+1))
-    for year in years:
-        # Country imports by detail sector
-        sr_i = get_subregion_imports(year)
-        if len(sr_i.query('`Import Quantity` <0')) > 0:
-            print('WARNING: negative import values...')
-    
-        if io_level == 'Summary':
-            u_c = get_detail_to_summary_useeio_concordance()
-            sr_i = (sr_i.merge(u_c, how='left', on='BEA Detail', validate='m:1'))
-    
-        else: # Detail
-            print('ERROR: not yet implemented')
-            sr_i = sr_i.rename(columns={'BEA Detail': 'BEA'})
-    
-        p_d = sr_i.copy()
-        p_d = p_d[['TiVA Region', 'CountryCode', 'BEA Summary',
-                   'BEA Detail', 'Import Quantity']]
-        c_d = calc_contribution_coefficients(p_d)
-    
-        if sum(c_d.duplicated(['CountryCode', 'BEA Detail'])) > 0:
-            print('Error calculating country coefficients by detail sector')
-        e_u = get_exio_to_useeio_concordance()
-        e_d = pull_exiobase_multipliers(year)
-        e_bil = pull_exiobase_bilateral_trade(year)
-        check = e_d.query('`Carbon dioxide` >= 100')
-        e_d = e_d.query('`Carbon dioxide` < 100') # Drop Outliers
-        ## TODO consider an alternate approach here
-    
-        e_d = (e_d.merge(e_bil, on=['CountryCode','Exiobase Sector'], how='left')
-                  .merge(e_u, on='Exiobase Sector', how='left')
-                  .drop(columns=['Exiobase Sector','Year']))
-        e_d = e_d.query('`Bilateral Trade Total` > 0')
-        # INSERT HERE TO REVIEW SECTOR CONTRIBUTIONS WITHIN A COUNTRY
-        agg = e_d.groupby(['BEA Detail', 'CountryCode']).agg('sum')
-        for c in [c for c in agg.columns if c not in ['Bilateral Trade Total']]:
-            agg[c] = get_weighted_average(e_d, c, 'Bilateral Trade Total', 
-                                          ['BEA Detail','CountryCode'])
-    
-        multiplier_df = c_d.merge(agg.reset_index().drop(columns='Bilateral Trade Total'),
-                                  how='left',
-                                  on=['CountryCode', 'BEA Detail'])
-        multiplier_df = multiplier_df.melt(
-            id_vars = [c for c in multiplier_df if c not in 
-                       config['flows'].values()],
-            var_name = 'Flow',
-            value_name = 'EF')
-    
-        multiplier_df = (
-            multiplier_df
-            .assign(Compartment='emission/air')
-            .assign(Unit='kg')
-            .assign(ReferenceCurrency='Euro')
-            .assign(CurrencyYear=str(year))
-            .assign(EmissionYear='2019' if year > 2019 else str(year))
-            # ^^ GHG data stops at 2019
-            .assign(PriceType='Basic')
-            )
-    
-        fl = (fedelem.get_flows()
-              .query('Flowable in @multiplier_df.Flow')
-              .filter(['Flowable', 'Context', 'Flow UUID'])
-              )
-        multiplier_df = (
-            multiplier_df
-            .merge(fl, how='left',
-                   left_on=['Flow', 'Compartment'],
-                   right_on=['Flowable', 'Context'],
-                   )
-            .drop(columns=['Flow', 'Compartment'])
-            .rename(columns={'Flow UUID': 'FlowUUID'})
-            )
-    
-        weighted_multipliers_bea_detail, weighted_multipliers_bea_summary = (
-            calculate_specific_emission_factors(multiplier_df))
-    
-        # Aggregate by TiVa Region
-        t_c = calc_tiva_coefficients(year)
-        imports_multipliers = calculateWeightedEFsImportsData(
-            # weighted_multipliers_bea_summary, t_c)
-            weighted_multipliers_bea_summary.query('Amount != 0'),
-            t_c.query('region_contributions_imports != 0'),
-            year)
-        check = (set(t_c.query('region_contributions_imports != 0')['BEA Summary']) - 
-                 set(weighted_multipliers_bea_summary.query('Amount != 0')['BEA Summary']))
-        if len(check) > 0:
-            print(f'There are sectors with imports but no emisson factors: {check}')
-        # Currency adjustment
-        c = CurrencyConverter(fallback_on_missing_rate=True)
-        exch = statistics.mean([c.convert(1, 'EUR', 'USD', date=date(year, 1, 1)),
-                                c.convert(1, 'EUR', 'USD', date=date(year, 12, 30))])
-        imports_multipliers = (
-            imports_multipliers
-            .assign(FlowAmount=lambda x: x['Amount']/exch)
-            .drop(columns='Amount')
-            .rename(columns={'BEA Summary': 'Sector'})
-            .assign(Unit='kg')
-            .assign(ReferenceCurrency='USD')
-            .assign(BaseIOLevel='Summary')
-            )
-        store_data(sr_i,
-                   imports_multipliers,
-                   weighted_multipliers_bea_detail,
-                   weighted_multipliers_bea_summary,
-                   year, mrio='exio')
+    failures = {}
+    if workers <= 1:
+        _init_worker(cache)
+        for year in years:
+            try:
+                generate_exio_factors_year(year, io_level, engine)
+                print(f'Completed {year}')
+            except Exception:
+                failures[year] = traceback.format_exc()
+                print(f'ERROR: {year} failed')
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(years)),
+                                 initializer=_init_worker,
+                                 initargs=(cache,)) as pool:
+            futures = {pool.submit(generate_exio_factors_year, year,
+                                   io_level, engine): year
+                       for year in years}
+            for f in as_completed(futures):
+                year = futures[f]
+                try:
+                    f.result()
+                    print(f'Completed {year}')
+                except Exception:
+                    failures[year] = traceback.format_exc()
+                    print(f'ERROR: {year} failed')
+    if failures:
+        print(f'{len(failures)} of {len(years)} years failed:')
+        for year, err in sorted(failures.items()):
+            print(f'--- {year} ---\n{err}')
+    return failures
+
+
+def _init_worker(cache=True):
+    '''
+    Loads concordances and reference data shared across years, once per
+    process, and enables or disables the stage cache.
+    '''
+    artifacts.settings['enabled'] = cache
+    load_all()
+    shared['flows'] = (fedelem.get_flows()
+                       .filter(['Flowable', 'Context', 'Flow UUID']))
+    shared['currency'] = CurrencyConverter(fallback_on_missing_rate=True)
+
+
+def generate_exio_factors_year(year, io_level='Summary', engine='pandas'):
+    '''
+    Produces emission factors for U.S. imports from exiobase for a single year
+    '''
+    if not shared:
+        _init_worker()
+    # Country imports by detail sector
+    sr_i = get_subregion_imports(year)
+    if len(sr_i.query('`Import Quantity` <0')) > 0:
+        print('WARNING: negative import values...')
+
+    if io_level == 'Summary':
+        u_c = get_detail_to_summary_useeio_concordance()
+        sr_i = (sr_i.merge(u_c, how='left', on='BEA Detail', validate='m:1'))
+
+    else: # Detail
+        print('ERROR: not yet implemented')
+        sr_i = sr_i.rename(columns={'BEA Detail': 'BEA'})
+
+    p_d = sr_i.copy()
+    p_d = p_d[['TiVA Region', 'CountryCode', 'BEA Summary',
+               'BEA Detail', 'Import Quantity']]
+    c_d = calc_contribution_coefficients(p_d)
+
+    if sum(c_d.duplicated(['CountryCode', 'BEA Detail'])) > 0:
+        print('Error calculating country coefficients by detail sector')
+    weighted_multipliers_bea_detail, weighted_multipliers_bea_summary = (
+        calc_exiobase_multipliers(c_d, year, engine))
+
+    # Aggregate by TiVa Region
+    t_c = calc_tiva_coefficients(year)
+    # Currency adjustment
+    c = shared['currency']
+    exch = statistics.mean([c.convert(1, 'EUR', 'USD', date=date(year, 1, 1)),
+                            c.convert(1, 'EUR', 'USD', date=date(year, 12, 30))])
+    imports_multipliers, tiva_summary = calc_imports_multipliers(
+        weighted_multipliers_bea_summary, t_c, year, exch)
+    check = (set(t_c.query('region_contributions_imports != 0')['BEA Summary']) - 
+             set(weighted_multipliers_bea_summary.query('Amount != 0')['BEA Summary']))
+    if len(check) > 0:
+        print(f'There are sectors with imports but no emisson factors: {check}')
+    store_data(sr_i,
+               imports_multipliers,
+               weighted_multipliers_bea_detail,
+               weighted_multipliers_bea_summary,
+               tiva_summary,
+               year, mrio='exio')
 
 
 def get_tiva_data(year):
     '''
     Iteratively pulls BEA imports data matricies from stored csv file,
     extracts the Total Imports columns by region, and consolidates 
-    into one dataframe. 
+    into one dataframe. Parsed matrices are cached, see load_tiva_matrix.
     
     https://apps.bea.gov/iTable/?reqid=157&step=1
     '''
@@ -179,31 +189,74 @@ def get_tiva_data(year):
                'Rest of Asia and Pacific': 'APAC',
                'Rest of World': 'ROW',
                }
-    ri_df = pd.DataFrame()
+    sums = []
     for region, abbv in regions.items():
-        r_path = f_n.replace('__region__', region)
-        df = (pd.read_csv(dataPath / r_path, skiprows=3, index_col=0)
-                 .drop(['IOCode'])
-                 .drop(['Commodities/Industries'], axis=1)
-                 .dropna()
-                 .apply(pd.to_numeric)
-                 )
-        df[abbv] = df[list(df.columns)].sum(axis=1) # row sums
-        ri_r = df[[abbv]]
-        ri_df = pd.concat([ri_df, ri_r], axis=1)
+        codes, values = load_tiva_matrix(
+            dataPath / f_n.replace('__region__', region))
+        sums.append(pd.Series(values.sum(axis=1), name=abbv, # row sums
+                              index=pd.Index(codes, name='IOCode')))
+    ri_df = pd.concat(sums, axis=1)
 
     return ri_df
 
 
+def load_tiva_matrix(path):
+    '''
+    Returns the commodity codes and values of a BEA import matrix. The
+    parsed matrix is stored as a compact binary file, keeping the parsed
+    dtype, and reused until the source csv changes (by modification time,
+    then content hash; a matching hash updates the stored time).
+    '''
+    tivaPath.mkdir(exist_ok=True)
+    cache = tivaPath / f'{path.stem}.npz'
+    mtime = path.stat().st_mtime_ns
+    digest = None
+    if cache.exists():
+        with np.load(cache) as c:
+            if int(c.get('version', 1)) == 2:
+                # ^^ version 1 stored the values as float
+                if int(c['mtime']) == mtime:
+                    return c['codes'], c['values']
+                digest = hashlib.sha256(path.read_bytes()).hexdigest()
+                if str(c['sha256']) == digest:
+                    codes, values = c['codes'], c['values']
+                    _store_tiva_matrix(cache, codes, values, mtime, digest)
+                    return codes, values
+    df = (pd.read_csv(path, skiprows=3, index_col=0)
+             .drop(['IOCode'])
+             .drop(['Commodities/Industries'], axis=1)
+             .dropna()
+             .apply(pd.to_numeric)
+             )
+    codes = df.index.to_numpy(dtype=str)
+    values = df.to_numpy()
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    _store_tiva_matrix(cache, codes, values, mtime, digest)
+    return codes, values
+
+
+def _store_tiva_matrix(cache, codes, values, mtime, digest):
+    tmp = cache.with_name(f'{cache.name}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez(f, codes=codes, values=values, mtime=mtime, sha256=digest,
+                 version=2)
+    os.replace(tmp, cache)
+
+
+@artifacts.stage(
+    files=lambda year: [
+        *sorted(dataPath.glob(
+            f'Import Matrix, *, After Redefinitions_{year}.csv')),
+        conPath / 'bea_imports_corr.csv'],
+    code=('get_tiva_data', 'load_tiva_matrix', 'get_concordance'))
 def calc_tiva_coefficients(year):
     '''
     Calculate the fractional contributions, by TiVA region, to total imports
     by BEA-summary sector. Resulting dataframe is long format. 
     '''
     t_df = get_tiva_data(year)
-    corr = (pd.read_csv(conPath / 'bea_imports_corr.csv',
-                        usecols=['BEA Imports', 'BEA Summary'])
-            .drop_duplicates())
+    corr = get_concordance('bea_imports_to_summary')
     # ^^ requires mapping of import codes to summary codes. These codes are 
     # between detail and summary.
 
@@ -232,30 +285,15 @@ def get_tiva_to_exio_concordance():
     '''
     Opens concordance dataframe of TiVA regions to exiobase countries.
     '''
-    path = conPath / 'exio_tiva_concordance.csv'
-    t_e = (pd.read_csv(path)
-             .rename(columns={'ISO 3166-alpha-2': 'CountryCode'}))
-    t_e = t_e[["TiVA Region","CountryCode"]]
-    return t_e
+    return get_concordance('tiva_to_exio')
 
 
 def get_exio_to_useeio_concordance():
     '''
-    Opens Exiobase to USEEIO binary concordance.
-    Transforms wide-form Exiobase to USEEIO concordance into long form, 
-    extracts all mappings to create new, two column concordance consisting of 
-    USEEIO detail and mappings to Exiobase.
-    modified slightly from: https://ntnu.app.box.com/v/EXIOBASEconcordances/file/983477211189
+    Opens Exiobase to USEEIO binary concordance, in long form: USEEIO detail
+    and mappings to Exiobase.
     '''
-    path = conPath / "exio_to_bea_commodity_concordance.csv"
-    e_u_b = (pd.read_csv(path, dtype=str)
-               .rename(columns={'Unnamed: 0':'BEA Detail'}))
-    e_u_b = e_u_b.iloc[:,:-4]
-    e_u_l = pd.melt(e_u_b, id_vars=['BEA Detail'], var_name='Exiobase Sector')
-    e_u = (e_u_l.query('value == "1"')
-                .reset_index(drop=True))
-    e_u = (e_u[['BEA Detail','Exiobase Sector']])
-    return e_u
+    return get_concordance('exio_to_useeio')
 
 
 def get_detail_to_summary_useeio_concordance():
@@ -264,26 +302,21 @@ def get_detail_to_summary_useeio_concordance():
     without waste disaggregation) sectors. USEEIO Detail with Waste Disagg 
     and corresponding summary-level codes. 
     '''
-    path = conPath / 'useeio_internal_concordance.csv'
-    u_cc = (pd.read_csv(path, dtype=str)
-              .rename(columns={'BEA_Detail_Waste_Disagg': 'BEA Detail',
-                               'BEA_Summary': 'BEA Summary'})
-              )
-    u_c = u_cc[['BEA Detail','BEA Summary']]
-    u_c = u_c.drop_duplicates()
-    return u_c
+    return get_concordance('detail_to_summary')
 
 
+@artifacts.stage(
+    prepare=lambda year: fetch_imports_data(year),
+    files=lambda year: [*get_imports_data_files(year),
+                        conPath / 'exio_tiva_concordance.csv'],
+    code=('get_imports_data', 'get_tiva_to_exio_concordance',
+          'get_concordance'))
 def get_subregion_imports(year):
     '''
     Generates dataset of imports by country by sector from BEA and Census
     '''
     sr_i = get_imports_data(year=year)
-    path = conPath / 'exio_tiva_concordance.csv'
-    regions = (pd.read_csv(path, dtype=str,
-                           usecols=['ISO 3166-alpha-2', 'TiVA Region'])
-               .rename(columns={'ISO 3166-alpha-2': 'CountryCode'})
-               )
+    regions = get_tiva_to_exio_concordance()
     sr_i = (sr_i.merge(regions, on='CountryCode', how='left', validate='m:1')
                 .rename(columns={'BEA Sector':'BEA Detail'}))
     # sr_i['Subregion Contribution'] = sr_i['Import Quantity']/sr_i.groupby('BEA Sector')['Import Quantity'].transform('sum')
@@ -291,20 +324,74 @@ def get_subregion_imports(year):
     return sr_i
 
 
+@lru_cache(maxsize=2)
+def load_exiobase_resources(year):
+    '''
+    Loads the stored Exiobase model for a year, keeping only the flows
+    selected in exio_config.yml and the US column of bilateral trade.
+    Prefers the slim parquet extract written by
+    process_exiobase(extract=True) and falls back to the full pickle.
+    Cached so that multipliers and bilateral trade are served from a
+    single load. Extracts written for another account or flow selection
+    than in exio_config.yml are rebuilt, see prepare_exiobase_resources.
+    '''
+    file = prepare_exiobase_resources(year)
+    if file.suffix == '.parquet':
+        index = list(config['fields'].keys())
+        df = pd.read_parquet(file).set_index(index)
+        flows = list(select_flows(df.columns.drop('US')))
+        return {'M': df[flows].transpose(),
+                'Bilateral Trade': df[['US']]}
+    with open(file, 'rb') as f:
+        exio = pkl.load(f)
+    M_df = exio['M']
+    account = exio.get('Account', 'impacts')
+    # ^^ pickles without an account predate its configuration
+    if account != get_account():
+        raise ValueError(f'{file.name} holds the {account} account, but '
+                         f'exio_config.yml selects {get_account()}; '
+                         'reprocess the year with process_exiobase')
+    resources = {
+        'M': M_df.loc[list(select_flows(M_df.index))],
+        'Bilateral Trade': exio['Bilateral Trade'].filter(['US']).copy(),
+        }
+    return resources
+
+
+def prepare_exiobase_resources(year):
+    '''
+    Returns the stored Exiobase resources of a year that
+    load_exiobase_resources reads: the extract if it matches
+    exio_config.yml, or else the full pickle. If neither exists, the
+    extract is (re)built, downloading the model if needed; this requires
+    pyarrow, while a setup with only the pickle runs without it.
+    '''
+    extract = resource_Path / f'exio_extract_{year}.parquet'
+    file = resource_Path / f'exio_all_resources_{year}.pkl'
+    if not is_current_extract(extract) and not file.exists():
+        if extract.exists():
+            print(f'Exiobase extract for {year} does not match '
+                  'exio_config.yml, rebuilding')
+        else:
+            print(f"Exiobase data not found for {year}")
+        model = model_Path / f'IOT_{year}_{model_type}.zip'
+        failures = process_exiobase(year_start=year, year_end=year,
+                                    download=not model.exists(),
+                                    extract=True)
+        if failures:
+            raise RuntimeError(f'Processing exiobase files for {year} '
+                               f'failed:\n{failures[year]}')
+    return extract if is_current_extract(extract) else file
+
+
 def pull_exiobase_multipliers(year):
     '''
     Extracts multiplier matrix from stored Exiobase model.
     '''
-    file = resource_Path / f'exio_all_resources_{year}.pkl'
-    if not file.exists():
-        print(f"Exiobase data not found for {year}")
-        process_exiobase(year_start=year, year_end=year, download=True)
-    exio = pkl.load(open(file,'rb'))
-    M_df = exio['M']
+    M_df = load_exiobase_resources(year)['M']
 
-    fields = {**config['fields'], **config['flows']}
+    fields = {**config['fields'], **select_flows(M_df.index)}
 
-    M_df = M_df.loc[M_df.index.isin(fields.keys())]
     M_df = (M_df
             .transpose()
             .reset_index()
@@ -318,22 +405,26 @@ def pull_exiobase_bilateral_trade(year):
     '''
     Extracts industry output vector from stored Exiobase model.
     '''
-    file = resource_Path / f'exio_all_resources_{year}.pkl'
-    if not file.exists():
-        print(f"Exiobase data not found for {year}")
-        process_exiobase(year_start=year, year_end=year, download=True)
-    exio = pkl.load(open(file,'rb'))
     fields = {**config['fields'], **config['flows']}
     fields['US'] = 'Bilateral Trade Total'
-    t_df = exio['Bilateral Trade']
+    t_df = load_exiobase_resources(year)['Bilateral Trade']
     t_df = (t_df
-            .filter(['US'])
             .reset_index()
             .rename(columns=fields)
             )
     return t_df
 
 
+def get_exiobase_flows(e_d):
+    '''
+    Returns the flow columns of the Exiobase multipliers in e_d, as returned
+    by pull_exiobase_multipliers.
+    '''
+    return [c for c in e_d if c not in [*config['fields'].values(), 'Year']]
+
+
+@artifacts.stage(
+    code=('calc_coefficients_bea_summary', 'calc_coefficients_bea_detail'))
 def calc_contribution_coefficients(p_d):
     '''
     Appends contribution coefficients to prepared dataframe.
@@ -392,30 +483,269 @@ def calc_coefficients_bea_detail(df):
     return df
 
 
-def calculate_specific_emission_factors(multiplier_df):
+@artifacts.stage(
+    files=lambda c_d, year, engine: [
+        prepare_exiobase_resources(year),
+        # ^^ builds the resources first if they are missing
+        dataPath / 'exio_config.yml',
+        conPath / 'exio_to_bea_commodity_concordance.csv',
+        shared['flows']],
+    code=('get_exio_to_useeio_concordance', 'get_concordance',
+          'pull_exiobase_multipliers', 'pull_exiobase_bilateral_trade',
+          'load_exiobase_resources', 'prepare_exiobase_resources',
+          'get_exiobase_flows', 'calc_weighted_multipliers',
+          'calc_weighted_averages', 'calc_weighted_multipliers_sparse',
+          'calculate_specific_emission_factors',
+          'stack_weighted_multipliers', 'assign_flow_metadata',
+          'get_flow_properties'))
+def calc_exiobase_multipliers(c_d, year, engine='pandas'):
+    '''
+    Joins the Exiobase multipliers and bilateral trade of a year to the BEA
+    sectors and weights them by the contribution coefficients in c_d, with
+    the engine calc_weighted_multipliers (pandas) or
+    calc_weighted_multipliers_sparse (sparse). Returns the weighted
+    multipliers by TiVA region and BEA detail and BEA summary sector.
+    '''
+    e_u = get_exio_to_useeio_concordance()
+    e_d = pull_exiobase_multipliers(year)
+    e_bil = pull_exiobase_bilateral_trade(year)
+    if 'Carbon dioxide' in e_d:
+        check = e_d.query('`Carbon dioxide` >= 100')
+        e_d = e_d.query('`Carbon dioxide` < 100') # Drop Outliers
+    ## TODO consider an alternate approach here
+
+    if engine == 'sparse':
+        return calc_weighted_multipliers_sparse(c_d, e_d, e_bil, e_u, year)
+    return calc_weighted_multipliers(c_d, e_d, e_bil, e_u, year)
+
+
+def calc_weighted_multipliers(c_d, e_d, e_bil, e_u, year):
+    '''
+    Averages the Exiobase multipliers of each country within each BEA detail
+    sector, weighted by bilateral trade, and applies the contribution
+    coefficients. Returns the weighted multipliers by TiVA region and BEA
+    detail and BEA summary sector. See calc_weighted_multipliers_sparse for
+    the same calculation as sparse matrix products.
+    '''
+    flows = get_exiobase_flows(e_d)
+    e_d = (e_d.merge(e_bil, on=['CountryCode','Exiobase Sector'], how='left')
+              .merge(e_u, on='Exiobase Sector', how='left')
+              .drop(columns=['Exiobase Sector','Year']))
+    e_d = e_d.query('`Bilateral Trade Total` > 0')
+    # INSERT HERE TO REVIEW SECTOR CONTRIBUTIONS WITHIN A COUNTRY
+    agg = calc_weighted_averages(
+        e_d, flows, 'Bilateral Trade Total', ['BEA Detail','CountryCode'])
+
+    multiplier_df = c_d.merge(agg.reset_index(),
+                              how='left',
+                              on=['CountryCode', 'BEA Detail'])
+
+    return calculate_specific_emission_factors(multiplier_df, flows, year)
+
+
+def calc_weighted_averages(df, cols, weight_col, agg_cols):
+    '''
+    Averages all cols weighted by weight_col within the groups of agg_cols,
+    in a single groupby-sum and divide for any number of columns. Missing
+    values do not count towards the weights of their column; averages
+    without weight are 0, as in esupy's get_weighted_average.
+    '''
+    values = df[cols].to_numpy(float)
+    weights = df[weight_col].to_numpy(float)[:, None]
+    notnull = ~np.isnan(values)
+    g = (pd.DataFrame(np.hstack([np.where(notnull, values * weights, 0),
+                                 notnull * weights]),
+                      index=df.index)
+           .groupby([df[c] for c in agg_cols]).sum())
+    num = g.iloc[:, :len(cols)].to_numpy()
+    den = g.iloc[:, len(cols):].to_numpy()
+    return pd.DataFrame(
+        np.divide(num, den, out=np.zeros_like(num), where=den != 0),
+        index=g.index, columns=cols)
+
+
+def calc_weighted_multipliers_sparse(c_d, e_d, e_bil, e_u, year):
+    '''
+    Same as calc_weighted_multipliers, for all flows at once as sparse
+    matrix products (requires scipy). With P the concordance of Exiobase
+    country-sectors to BEA detail sector-country pairs, W the diagonal of
+    bilateral trade, M the multipliers and N = notnull(M), the weighted
+    multipliers are EF = (P'WM) / (P'WN), or 0 without trade. The results
+    by TiVA region and BEA detail or BEA summary sector are then C_d EF and
+    C_s EF, with the contribution coefficients of the country-sector pairs
+    in C_d and C_s.
+    '''
+    from scipy import sparse
+
+    flows = get_exiobase_flows(e_d)
+    e_d = e_d.merge(e_bil, on=['CountryCode','Exiobase Sector'], how='left')
+    e_d = e_d[e_d['Bilateral Trade Total'] > 0]
+    e_u = e_u.dropna()
+    sectors = pd.Index(pd.unique(e_u['Exiobase Sector']))
+    details = pd.Index(pd.unique(pd.concat([e_u['BEA Detail'],
+                                            c_d['BEA Detail']]).dropna()))
+    countries = pd.Index(pd.unique(pd.concat([e_d['CountryCode'],
+                                              c_d['CountryCode']]).dropna()))
+    n_g = len(details) * len(countries)
+
+    # P: Exiobase country-sectors to BEA detail-country pairs, via the
+    # sector concordance
+    k = np.arange(len(e_d))
+    s = sectors.get_indexer(e_d['Exiobase Sector'])
+    S = sparse.csr_matrix((np.ones((s >= 0).sum()), (k[s >= 0], s[s >= 0])),
+                          shape=(len(e_d), len(sectors)))
+    E = sparse.csr_matrix((np.ones(len(e_u)),
+                           (sectors.get_indexer(e_u['Exiobase Sector']),
+                            details.get_indexer(e_u['BEA Detail']))),
+                          shape=(len(sectors), len(details)))
+    SE = (S @ E).tocoo()
+    g = (SE.col * len(countries)
+         + countries.get_indexer(e_d['CountryCode'])[SE.row])
+    PtW = sparse.csr_matrix(
+        (SE.data * e_d['Bilateral Trade Total'].to_numpy(float)[SE.row],
+         (g, SE.row)), shape=(n_g, len(e_d)))
+
+    M = e_d[flows].to_numpy(float)
+    N = ~np.isnan(M)
+    num = PtW @ np.where(N, M, 0)
+    den = PtW @ N.astype(float)
+    EF = np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+
+    # contribution coefficients by TiVA region and BEA sector
+    d = details.get_indexer(c_d['BEA Detail'])
+    c = countries.get_indexer(c_d['CountryCode'])
+    pair = np.where((d >= 0) & (c >= 0), d * len(countries) + c, -1)
+
+    def weigh(level, coefficients, amount):
+        keys = c_d[['TiVA Region', level]]
+        known = keys.notna().all(axis=1).to_numpy()
+        codes, groups = pd.MultiIndex.from_frame(keys[known]).factorize()
+        r = pair[known]
+        v = c_d[coefficients].to_numpy(float)[known]
+        ok = (r >= 0) & ~np.isnan(v)
+        C = sparse.csr_matrix((v[ok], (codes[ok], r[ok])),
+                              shape=(len(groups), n_g))
+        return stack_weighted_multipliers(groups, C @ EF, flows, level,
+                                          amount, year)
+
+    return (weigh('BEA Detail', 'Subregion Contribution to Detail',
+                  'Amount_detail'),
+            weigh('BEA Summary', 'Subregion Contribution to Summary',
+                  'Amount'))
+
+
+def stack_weighted_multipliers(groups, values, flows, level, amount, year):
+    '''
+    Returns the weighted multipliers in values, with one row per TiVA region
+    and level sector pair in groups and one column per flow, in long form
+    with the flow metadata. The metadata is assigned once per flow and rows
+    are sorted as by a groupby over the pair and the metadata.
+    '''
+    meta = assign_flow_metadata(
+        pd.DataFrame({'Flow': flows, 'flow': range(len(flows))}), year)
+    col = [c for c in meta if c in flow_cols]
+    meta = meta.sort_values(col).reset_index(drop=True)
+    order = groups.argsort()
+    groups = groups[order]
+    n = len(meta)
+    df = pd.concat(
+        [pd.DataFrame({
+            'TiVA Region': np.repeat(groups.get_level_values(0), n),
+            level: np.repeat(groups.get_level_values(1), n)}),
+         meta[col].iloc[np.tile(np.arange(n), len(groups))]
+             .reset_index(drop=True)],
+        axis=1)
+    df[amount] = np.asarray(values)[order][:, meta['flow']].ravel()
+    return df
+
+
+def assign_flow_metadata(df, year):
+    '''
+    Adds the flow, unit and currency metadata to the emission factors in the
+    Flow column and maps the flows to the Federal LCA Commons elementary
+    flow list. Flows missing from the list, e.g. stressors selected by
+    pattern, keep their own name and context.
+    '''
+    properties = {f: get_flow_properties(f) for f in pd.unique(df['Flow'])}
+    df = (
+        df
+        .assign(Compartment=df['Flow'].map(
+            {f: p[0] for f, p in properties.items()}))
+        .assign(Unit=df['Flow'].map(
+            {f: p[1] for f, p in properties.items()}))
+        .assign(ReferenceCurrency='Euro')
+        .assign(CurrencyYear=str(year))
+        .assign(EmissionYear='2019' if year > 2019 else str(year))
+        # ^^ GHG data stops at 2019
+        .assign(PriceType='Basic')
+        )
+
+    fl = shared['flows'].query('Flowable in @df.Flow')
+    df = (
+        df
+        .merge(fl, how='left',
+               left_on=['Flow', 'Compartment'],
+               right_on=['Flowable', 'Context'],
+               )
+        .assign(Flowable=lambda x: x['Flowable'].fillna(x['Flow']),
+                Context=lambda x: x['Context'].fillna(x['Compartment']))
+        .drop(columns=['Flow', 'Compartment'])
+        .rename(columns={'Flow UUID': 'FlowUUID'})
+        .fillna({'FlowUUID': ''})
+        )
+    return df
+
+
+def calculate_specific_emission_factors(multiplier_df, flows, year):
     '''
     Calculates TiVA-exiobase sector and TiVA-bea summary sector emission
-    multipliers.
+    multipliers. The multipliers of all flows are weighted by the
+    contribution coefficients and summed in wide form, one column per flow,
+    before the flow metadata is added.
     '''
-    
-    multiplier_df = (multiplier_df
-                     .assign(Amount_detail = (multiplier_df['EF'] *
-                             multiplier_df['Subregion Contribution to Detail']))
-                     .assign(Amount = (multiplier_df['EF'] *
-                             multiplier_df['Subregion Contribution to Summary']))
-                     )
-    # INSERT HERE TO GET DATA BY COUNTRY
-    col = [c for c in multiplier_df if c in flow_cols]
-
-    weighted_multipliers_bea_detail = (multiplier_df
-        .groupby(['TiVA Region','BEA Detail'] + col)
-        .agg({'Amount_detail': 'sum'}).reset_index())
-    weighted_multipliers_bea_summary = (multiplier_df
-        .groupby(['TiVA Region','BEA Summary'] + col)
-        .agg({'Amount': 'sum'}).reset_index())
+    EF = multiplier_df[flows].to_numpy(float)
+
+    def weigh(level, coefficients, amount):
+        # INSERT HERE TO GET DATA BY COUNTRY
+        g = (pd.DataFrame(EF * multiplier_df[coefficients]
+                                  .to_numpy(float)[:, None])
+               .groupby([multiplier_df['TiVA Region'],
+                         multiplier_df[level]]).sum())
+        return stack_weighted_multipliers(g.index, g.to_numpy(), flows,
+                                          level, amount, year)
+
+    weighted_multipliers_bea_detail = weigh(
+        'BEA Detail', 'Subregion Contribution to Detail', 'Amount_detail')
+    weighted_multipliers_bea_summary = weigh(
+        'BEA Summary', 'Subregion Contribution to Summary', 'Amount')
     return(weighted_multipliers_bea_detail, weighted_multipliers_bea_summary)
 
 
+@artifacts.stage(code=('calculateWeightedEFsImportsData',))
+def calc_imports_multipliers(weighted_multipliers, t_c, year, exch):
+    '''
+    Weights the multipliers by TiVA region and BEA summary sector by the
+    contributions of the TiVA regions to imports and converts them from
+    Euro to USD at the exchange rate exch. Returns the imports multipliers
+    and the contributions by TiVA region, see
+    calculateWeightedEFsImportsData.
+    '''
+    imports_multipliers, tiva_summary = calculateWeightedEFsImportsData(
+        # weighted_multipliers, t_c)
+        weighted_multipliers.query('Amount != 0'),
+        t_c.query('region_contributions_imports != 0'),
+        year)
+    imports_multipliers = (
+        imports_multipliers
+        .assign(FlowAmount=lambda x: x['Amount']/exch)
+        .drop(columns='Amount')
+        .rename(columns={'BEA Summary': 'Sector'})
+        .assign(ReferenceCurrency='USD')
+        .assign(BaseIOLevel='Summary')
+        )
+    return imports_multipliers, tiva_summary
+
+
 def calculateWeightedEFsImportsData(weighted_multipliers,
                                     import_contribution_coeffs, year):
     '''
@@ -427,6 +757,7 @@ def calculateWeightedEFsImportsData(weighted_multipliers,
     such as unweighted Exiobase multipliers and used contribution factors, 
     are dropped from the dataframe. Other than weighted burden columns, the 
     output dataframe only continues to include 'USEEIO Summary' codes.
+    Also returns the multipliers' contributions by TiVA region.
     '''
     weighted_df_imports = (
         weighted_multipliers
@@ -454,9 +785,6 @@ def calculateWeightedEFsImportsData(weighted_multipliers,
                                        tiva_summary.groupby(['BEA Summary', 'Flowable'])
                                        ['Amount'].transform('sum'))
 
-    tiva_summary.drop(columns='Amount').to_csv(out_Path /
-        f'import_multipliers_by_TiVA_{year}.csv')
-
     col = [c for c in weighted_df_imports if c in flow_cols]
 
     imports_multipliers = (
@@ -466,15 +794,18 @@ def calculateWeightedEFsImportsData(weighted_multipliers,
         .reset_index()
         )
 
-    return imports_multipliers
+    return imports_multipliers, tiva_summary.drop(columns='Amount')
 
 def store_data(sr_i,
                imports_multipliers,
                weighted_multipliers_bea_detail,
                weighted_multipliers_bea_summary,
+               tiva_summary,
                year,
                mrio):
     out_Path.mkdir(exist_ok=True)
+    tiva_summary.to_csv(
+        out_Path / f'import_multipliers_by_TiVA_{year}.csv')
     imports_multipliers.to_csv(
         out_Path /f'imports_multipliers_{mrio}_{year}.csv', index=False)
     sr_i.to_csv(
@@ -487,4 +818,20 @@ def store_data(sr_i,
 
 #%%
 if __name__ == '__main__':
-    generate_exio_factors(year_start=2013, year_end=2013)
+    parser = argparse.ArgumentParser(
+        description='Generate emission factors for U.S. imports from exiobase')
+    parser.add_argument('--year_start', type=int, default=2013)
+    parser.add_argument('--year_end', type=int, default=2013)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of years to process concurrently')
+    parser.add_argument('--engine', default='pandas',
+                        choices=['pandas', 'sparse'],
+                        help='calculation of the weighted multipliers, see '
+                             'calc_weighted_multipliers')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='recompute all stages instead of reusing '
+                             'cached results, see artifacts.py')
+    args = parser.parse_args()
+    generate_exio_factors(year_start=args.year_start, year_end=args.year_end,
+                          workers=args.workers, engine=args.engine,
+                          cache=not args.no_cache)
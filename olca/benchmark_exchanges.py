@@ -0,0 +1,178 @@
+"""
+Benchmark of the creation of the process exchanges in u2o on a synthetic
+model of the size of a detail-level USEEIO model (about 400 sectors and
+3000 flows). The element-wise loops of earlier versions, which test every
+entry of a sector's columns of A and B, are compared with the current
+functions, which visit only the non-zero entries of the columns. The
+exchanges of both are checked for agreement before the timings are printed.
+With `--convert`, the synthetic model is also written to a temporary folder
+and converted to a JSON-LD package.
+
+    python benchmark_exchanges.py [--sectors 400] [--flows 3000]
+                                  [--repeat 3] [--convert]
+"""
+import argparse
+import csv
+import os
+import struct
+import tempfile
+import time
+from typing import List, Tuple
+
+import numpy
+
+import u2o
+
+
+def make_model(sectors=400, flows=3000, indicators=30,
+               seed=0) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray,
+                                List[List[str]], List[List[str]],
+                                List[List[str]]]:
+    """Returns the matrices A, B and C and the rows of the sector, flow and
+    indicator CSV files of a synthetic model. About 15% of A, 5% of B and
+    30% of C are non-zero."""
+    rng = numpy.random.default_rng(seed)
+    A = rng.random((sectors, sectors)) * (rng.random((sectors, sectors)) < 0.15)
+    B = rng.random((flows, sectors)) * (rng.random((flows, sectors)) < 0.05)
+    C = (rng.random((indicators, flows))
+         * (rng.random((indicators, flows)) < 0.3))
+    categories = ['Agriculture/Crops', 'Mining/', 'Manufacturing/Food', '']
+    sector_rows = [[str(i), f'{i:04d}X0/US', f'Sector {i}', f'{i:04d}X0',
+                    'US', categories[i % 4], f'Sector {i}']
+                   for i in range(sectors)]
+    contexts = ['emission/air', 'resource/ground', 'Waste/landfill',
+                'emission/water']
+    units = ['kg', 'kBq', 'm2*a', 'MJ', 'p', 'USD']
+    flow_rows = [[str(i), f'flow{i}/{contexts[i % 4]}/{units[i % 6]}',
+                  f'Flow {i}', contexts[i % 4], units[i % 6], '']
+                 for i in range(flows)]
+    groups = ['Waste Generated', 'Economic & Social', 'Impact Potential']
+    indicator_rows = [[str(i), f'Ind {i}', f'Indicator {i}', f'I{i}', 'kg',
+                       groups[i % 3]] for i in range(indicators)]
+    return A, B, C, sector_rows, flow_rows, indicator_rows
+
+
+def write_model(folder: str, A, B, C, sector_rows, flow_rows,
+                indicator_rows):
+    """Writes a synthetic model in the format of a USEEIO model folder."""
+    for name, m in (('A', A), ('B', B), ('C', C)):
+        with open(os.path.join(folder, f'{name}.bin'), 'wb') as f:
+            f.write(struct.pack('<ii', *m.shape))
+            f.write(numpy.asfortranarray(m, dtype='<f8').tobytes(order='F'))
+    tables = [
+        ('sectors.csv', ['index', 'id', 'name', 'code', 'location',
+                         'category', 'description'], sector_rows),
+        ('flows.csv', ['index', 'id', 'name', 'context', 'unit', 'uuid'],
+         flow_rows),
+        ('indicators.csv', ['index', 'id', 'name', 'code', 'unit', 'group'],
+         indicator_rows),
+        ('demands.csv', ['id', 'year', 'type', 'system', 'location'], []),
+    ]
+    for file, header, rows in tables:
+        with open(os.path.join(folder, file), 'w', encoding='utf-8',
+                  newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def loop_tech_exchanges(sector: u2o._Sector, sectors: List[u2o._Sector],
+                        A: numpy.ndarray) -> List[dict]:
+    """The creation of the technosphere exchanges of earlier versions."""
+    col = sector.index
+    exchanges = []
+    for other in sectors:
+        row = other.index
+        amount = A[row, col]
+        if amount == 0:
+            continue
+        exchanges.append({
+            'input': True,
+            'amount': amount,
+            'flow': {'@id': u2o._uid('flow', other.uid)},
+            'unit': {'@id': u2o._RefIds.UNIT_USD},
+            'flowProperty': {'@id': u2o._RefIds.QUANTITY_USD},
+            'defaultProvider': {'@id': u2o._uid('process', other.uid)}
+        })
+    return exchanges
+
+
+def loop_envi_exchanges(sector: u2o._Sector, flows: List[u2o._Flow],
+                        B: numpy.ndarray) -> List[dict]:
+    """The creation of the environmental exchanges of earlier versions."""
+    col = sector.index
+    exchanges = []
+    for flow in flows:
+        row = flow.index
+        amount = B[row, col]
+        if amount == 0:
+            continue
+        exchanges.append({
+            'input': flow.context.lower().strip().startswith('resource'),
+            'amount': amount,
+            'flow': {'@id': flow.uid},
+            'unit': {'@id': u2o._RefIds.of_unit(flow.unit)},
+            'flowProperty': {'@id': u2o._RefIds.of_quantity(flow.unit)}
+        })
+    return exchanges
+
+
+def run_loop(sectors, flows, A, B) -> List[List[dict]]:
+    return [loop_tech_exchanges(s, sectors, A)
+            + loop_envi_exchanges(s, flows, B) for s in sectors]
+
+
+def run_columns(sectors, flows, A, B) -> List[List[dict]]:
+    sector_refs = u2o._SectorRefs(sectors)
+    flow_refs = u2o._FlowRefs(flows)
+    return [u2o._create_tech_exchanges(A[:, s.index], sector_refs)
+            + u2o._create_envi_exchanges(B[:, s.index], flow_refs)
+            for s in sectors]
+
+
+def best_time(f, repeat: int) -> Tuple[float, object]:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sectors', type=int, default=400)
+    parser.add_argument('--flows', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--convert', action='store_true',
+                        help='also time a full conversion of the model')
+    args = parser.parse_args()
+
+    model = make_model(args.sectors, args.flows)
+    A, B, _, sector_rows, flow_rows, _ = model
+    sectors = [u2o._Sector(row) for row in sector_rows]
+    flows = [u2o._Flow(row) for row in flow_rows]
+
+    t_loop, loop = best_time(lambda: run_loop(sectors, flows, A, B),
+                             args.repeat)
+    t_columns, columns = best_time(lambda: run_columns(sectors, flows, A, B),
+                                   args.repeat)
+    if loop != columns:
+        raise AssertionError('the exchanges of the two versions differ')
+    count = sum(len(exchanges) for exchanges in columns)
+    print(f'{len(sectors)} sectors, {len(flows)} flows, {count} exchanges')
+    print(f'element-wise loop:  {t_loop:8.3f} s')
+    print(f'non-zero columns:   {t_columns:8.3f} s')
+
+    if args.convert:
+        with tempfile.TemporaryDirectory() as folder:
+            write_model(folder, *model)
+            zip_path = os.path.join(folder, 'model.zip')
+            t_convert, _ = best_time(
+                lambda: u2o.convert(folder, zip_path), args.repeat)
+        print(f'full conversion:    {t_convert:8.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,25 +6,54 @@ stand-alone script with no other dependencies than NumPy and the Python 3.x
 standard library. This script can be executed from the command line like this:
 
 ```
-$ python3 u2o.py [USEEIO data folder] [openLCA JSON-LD zip file]
+$ python3 u2o.py [USEEIO data folder] [openLCA JSON-LD zip file] [--workers N]
 ```
+
+The matrices A, B and C are read from dense `.bin` files or from sparse
+`.npz` files as written by `scipy.sparse.save_npz` (CSC, CSR or COO), which
+are read with NumPy alone; see `_is_valid_useeio_folder`.
+
+With `--batch`, the folder argument is a glob pattern or a manifest file of
+model folders and the zip argument an output directory; the models are then
+converted in a pool of `--workers` processes, see `convert_batch`:
+
+```
+$ python3 u2o.py --batch 'models/*' [output folder] --workers 4
+```
+
+With `--incremental`, a rerun against an existing package only re-creates
+the process, impact category and demand data sets whose inputs changed; see
+`_Manifest`.
 """
 
+import argparse
+import collections
+import concurrent.futures
 import csv
+import io
 import json
 import yaml
 import datetime
+import glob
+import hashlib
 import logging as log
 import os.path
 import struct
 import sys
+import time
 import uuid
 import zipfile
 
-from typing import Dict, List, Optional, Tuple
+from copy import copy
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 MODEL_VERSION = '2.0.1'
 MODEL_NAME = '2.0.1-411'
 USEEIOR_VERSION = '1.0.2'
@@ -174,9 +203,497 @@ class _Source:
         return obj
 
 
-def convert(folder_path, zip_path, bib_path=None):
+class _SectorRefs:
+    """Matrix rows and reference objects of the sectors, computed once per
+    model so that creating an exchange is a list lookup."""
+
+    def __init__(self, sectors: List[_Sector]):
+        self.rows = _row_indices(sectors)
+        self.flows = [{'@id': _uid('flow', s.uid)} for s in sectors]
+        self.providers = [{'@id': _uid('process', s.uid)} for s in sectors]
+
+
+class _FlowRefs:
+    """Matrix rows and reference objects of the flows, computed once per
+    model. Unit and flow property references are shared between flows
+    with the same unit."""
+
+    def __init__(self, flows: List[_Flow]):
+        self.rows = _row_indices(flows)
+        self.flows = [{'@id': f.uid} for f in flows]
+        self.inputs = [f.context.lower().strip().startswith('resource')
+                       for f in flows]
+        units: Dict[str, Tuple[dict, dict]] = {}
+        for f in flows:
+            if f.unit not in units:
+                units[f.unit] = ({'@id': _RefIds.of_unit(f.unit)},
+                                 {'@id': _RefIds.of_quantity(f.unit)})
+        self.units = [units[f.unit][0] for f in flows]
+        self.quantities = [units[f.unit][1] for f in flows]
+        self.factors = [{'flow': flow, 'unit': unit, 'flowProperty': quantity}
+                        for flow, unit, quantity
+                        in zip(self.flows, self.units, self.quantities)]
+
+
+class _Context:
+    """The parts of the data sets that are the same for all processes of a
+    conversion, built once: the documentation of the sector and demand
+    processes with the references to the sources. The documentation objects
+    are shared by the processes and must not be modified."""
+
+    def __init__(self, source_list: List[_Source]):
+        self.source_list = source_list
+        self.process_doc = _process_doc(metadata, source_list)
+        self.demand_doc = _process_doc(demand_metadata)
+
+
+# the powers of ten that are exact in float64
+_POW10 = 10.0 ** numpy.arange(23)
+
+
+def _round_significant(values: numpy.ndarray, digits: int) -> numpy.ndarray:
+    """Rounds the values to `digits` significant digits in bulk, with the
+    same result as `float(format(v, f'.{digits}g'))` for each value.
+
+    A value is scaled to an integer of `digits` digits by an exact power of
+    ten, rounded and scaled back; both scalings are a single correctly
+    rounded operation. Values are formatted one by one instead when they
+    are outside the range of the exact powers, when their scaled value is
+    too close to a tie or to a power of ten for the float product to decide
+    the rounding, or when the array is too short for the array operations
+    to pay off. With 17 or more digits every float64 value is its own
+    rounding."""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if digits >= 17:
+        return values
+    fmt = f'.{digits}g'
+    if values.size < 64:
+        return numpy.array([float(format(x, fmt)) for x in values.tolist()])
+    rounded = values.copy()
+    mask = numpy.isfinite(values) & (values != 0)
+    v = values[mask]
+    exp = (digits - 1
+           - numpy.floor(numpy.log10(numpy.abs(v))).astype(numpy.int64))
+    scale = _POW10[numpy.minimum(numpy.abs(exp), 22)]
+    up = exp >= 0
+    scaled = numpy.where(up, v * scale, v / scale)
+    ints = numpy.round(scaled)
+    result = numpy.where(up, ints / scale, ints * scale)
+    size = numpy.abs(scaled)
+    slow = ((numpy.abs(exp) > 22)
+            | (size < 10.0 ** (digits - 1)) | (size >= 10.0 ** digits)
+            | (numpy.abs(numpy.abs(scaled - numpy.trunc(scaled)) - 0.5)
+               <= size * 2.0 ** -50))
+    slow = numpy.flatnonzero(slow)
+    result[slow] = [float(format(x, fmt)) for x in v[slow].tolist()]
+    rounded[mask] = result
+    return rounded
+
+
+class _JsonEncoder:
+    """Serializes the JSON-LD objects of the package.
+
+    The `auto` backend uses orjson when it is installed and the standard
+    library `json` module otherwise; `json` always uses the standard library
+    and produces the same output as earlier versions of this script. Matrix
+    values are converted to Python floats in bulk via `floats`, optionally
+    rounded to `float_precision` significant digits, see
+    `_round_significant`.
+    """
+
+    def __init__(self, backend: str = 'auto',
+                 float_precision: Optional[int] = None):
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'json'
+        if backend == 'orjson' and orjson is None:
+            raise ValueError('the orjson backend requires the orjson package')
+        if backend not in ('orjson', 'json'):
+            raise ValueError(f'unknown JSON backend {backend}')
+        if float_precision is not None and float_precision < 1:
+            raise ValueError('float_precision must be at least 1')
+        self.backend = backend
+        self.float_precision = float_precision
+
+    def dumps(self, obj: dict) -> Union[str, bytes]:
+        if self.backend == 'orjson':
+            return orjson.dumps(obj)
+        return json.dumps(obj)
+
+    def iterencode(self, obj: dict) -> Iterable[bytes]:
+        if self.backend == 'orjson':
+            return [orjson.dumps(obj)]
+        return (chunk.encode('utf-8')
+                for chunk in json.JSONEncoder().iterencode(obj))
+
+    def floats(self, values: numpy.ndarray) -> List[float]:
+        if self.float_precision is None:
+            return values.tolist()
+        return _round_significant(values, self.float_precision).tolist()
+
+
+_encoder = _JsonEncoder()
+
+
+class _PackageZip(zipfile.ZipFile):
+    """The zip file of the JSON-LD package.
+
+    `compression` is `stored` (fastest, e.g. for a local import into openLCA)
+    or `deflate` with an optional `compresslevel` from 1 (fast) to 9 (small,
+    e.g. for distribution). With `stream`, objects are encoded in chunks
+    directly into their zip entry instead of being held as a full string in
+    memory first; with the standard library encoder this is slower, as its
+    chunked encoding runs in pure Python.
+    """
+
+    COMPRESSION = {
+        'stored': zipfile.ZIP_STORED,
+        'deflate': zipfile.ZIP_DEFLATED,
+    }
+
+    def __init__(self, path: str, compression: str = 'deflate',
+                 compresslevel: Optional[int] = None, stream: bool = False,
+                 manifest: Optional['_Manifest'] = None,
+                 previous: Optional[zipfile.ZipFile] = None):
+        if compression not in _PackageZip.COMPRESSION:
+            raise ValueError(f'unknown compression {compression}')
+        super().__init__(path, mode='w',
+                         compression=_PackageZip.COMPRESSION[compression],
+                         compresslevel=compresslevel)
+        self.stream = stream
+        self.manifest = manifest
+        self.previous = previous
+
+    def close(self):
+        super().close()
+        if self.previous is not None:
+            self.previous.close()
+
+    def reuse(self, names: List[str], digest: str) -> bool:
+        """Records the input digest of the entries with the given names and
+        copies them from the previous package when their inputs did not
+        change. Returns `False` when the entries need to be written."""
+        if self.manifest is None:
+            return False
+        for name in names:
+            self.manifest.digests[name] = digest
+        if self.previous is None:
+            return False
+        infos = []
+        for name in names:
+            if self.manifest.previous.get(name) != digest:
+                return False
+            try:
+                infos.append(self.previous.getinfo(name))
+            except KeyError:
+                return False
+        for info in infos:
+            self.copy_entry(info)
+        return True
+
+    def copy_entry(self, info: zipfile.ZipInfo):
+        # copies the local header and the compressed data of the entry as
+        # they are; entries with a trailing data descriptor are rare in
+        # packages written to a file and are simply re-compressed
+        if info.flag_bits & 0x08:
+            self.writestr(info.filename, self.previous.read(info))
+            return
+        src = self.previous.fp
+        src.seek(info.header_offset)
+        header = src.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        data = header + src.read(name_len + extra_len + info.compress_size)
+        entry = copy(info)
+        with self._lock:
+            self.fp.seek(self.start_dir)
+            entry.header_offset = self.fp.tell()
+            self._didModify = True
+            self.filelist.append(entry)
+            self.NameToInfo[entry.filename] = entry
+            self.fp.write(data)
+            self.start_dir = self.fp.tell()
+
+    def write_json(self, name: str, obj: dict):
+        if not self.stream:
+            self.writestr(name, _encoder.dumps(obj))
+            return
+        with self.open(name, mode='w') as entry, \
+                io.BufferedWriter(entry, buffer_size=1 << 16) as out:
+            for chunk in _encoder.iterencode(obj):
+                out.write(chunk)
+
+
+class _Manifest:
+    """Content hashes of the inputs of the data sets in a package.
+
+    The manifest is stored next to the package as `<zip file>.manifest.json`
+    and maps the entry names of the processes (a column of A and B), impact
+    categories (a row of C) and demands (a demand JSON file) to a digest of
+    their inputs. All digests also cover the model-wide inputs in `context`,
+    e.g. the sector and flow lists, the metadata and the output settings. The
+    creation date is not part of the inputs, so copied data sets keep the
+    date of the run that created them.
+    """
+
+    VERSION = 1
+
+    def __init__(self, zip_path: str, context: object):
+        self.path = zip_path + '.manifest.json'
+        self.previous: Dict[str, str] = {}
+        self.digests: Dict[str, str] = {}
+        self.base = hashlib.sha256(
+            json.dumps(context, sort_keys=True, default=str).encode('utf-8'))
+
+    def digest(self, *parts: Union[str, bytes, numpy.ndarray]) -> str:
+        h = self.base.copy()
+        for part in parts:
+            if isinstance(part, numpy.ndarray):
+                part = numpy.ascontiguousarray(part).tobytes()
+            elif isinstance(part, str):
+                part = part.encode('utf-8')
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            log.warning('could not read manifest %s', self.path)
+            return False
+        if data.get('version') != _Manifest.VERSION:
+            return False
+        self.previous = data.get('entries', {})
+        return True
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': _Manifest.VERSION,
+                       'entries': self.digests}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+class _MatrixReader:
+    """A matrix file of the API export: the number of rows and columns as
+    32 bit integers, followed by the values as 64 bit floats in column-major
+    order.
+
+    The file size is checked against the shape in the header. The values are
+    memory-mapped read-only or, with `fromfile`, read in contiguous blocks of
+    columns via `numpy.fromfile`. `column_blocks` and `row_blocks` walk the
+    file in storage order; blocks hold about `BLOCK_BYTES` of values unless a
+    block size is given.
+    """
+
+    BLOCK_BYTES = 1 << 26
+
+    def __init__(self, file_path: str, fromfile: bool = False):
+        self.path = file_path
+        self.fromfile = fromfile
+        self.shape = _read_matrix_shape(file_path)
+        rows, cols = self.shape
+        expected = 8 + 8 * rows * cols
+        size = os.path.getsize(file_path)
+        if rows < 0 or cols < 0 or size != expected:
+            raise ValueError(
+                f'{file_path}: a {rows}x{cols} matrix needs {expected} '
+                f'bytes but the file has {size}')
+        self._map: Optional[numpy.ndarray] = None
+
+    def matrix(self) -> numpy.ndarray:
+        if self._map is None:
+            self._map = numpy.memmap(self.path, mode='r', dtype='<f8',
+                                     shape=self.shape, offset=8, order='F')
+        return self._map
+
+    def columns(self, start: int, stop: int) -> numpy.ndarray:
+        if not self.fromfile:
+            return self.matrix()[:, start:stop]
+        rows = self.shape[0]
+        with open(self.path, 'rb') as f:
+            f.seek(8 + 8 * rows * start)
+            values = numpy.fromfile(f, dtype='<f8',
+                                    count=rows * (stop - start))
+        return values.reshape((rows, stop - start), order='F')
+
+    def column(self, index: int) -> numpy.ndarray:
+        return self.columns(index, index + 1)[:, 0]
+
+    def column_blocks(self, block_size: Optional[int] = None
+                      ) -> Iterator[Tuple[int, numpy.ndarray]]:
+        """Yields the index of the first column and the values of each
+        block of columns."""
+        rows, cols = self.shape
+        if block_size is None:
+            block_size = max(1, _MatrixReader.BLOCK_BYTES // (8 * rows or 1))
+        for start in range(0, cols, block_size):
+            yield start, self.columns(start, min(start + block_size, cols))
+
+    def row_blocks(self, block_size: Optional[int] = None
+                   ) -> Iterator[Tuple[int, numpy.ndarray]]:
+        """Yields the index of the first row and the values of each block
+        of rows. A block is assembled from column blocks, so each block of
+        rows is one sequential pass over the file."""
+        rows, cols = self.shape
+        if block_size is None:
+            block_size = max(1, _MatrixReader.BLOCK_BYTES // (8 * cols or 1))
+        for start in range(0, rows, block_size):
+            stop = min(start + block_size, rows)
+            block = numpy.empty((stop - start, cols))
+            for col, columns in self.column_blocks():
+                block[:, col:col + columns.shape[1]] = columns[start:stop]
+            yield start, block
+
+
+class _SparseMatrixReader:
+    """A sparse matrix file in the `.npz` format of `scipy.sparse.save_npz`
+    with the same shape semantics as the dense matrix files.
+
+    CSC matrices are read column by column, CSR matrices row by row; the
+    other orientation and COO matrices are compressed once on first use.
+    Only the non-zero entries and one dense block are held in memory; blocks
+    have the same size as those of `_MatrixReader`. `fromfile` has no effect
+    and is only accepted for the same interface.
+    """
+
+    def __init__(self, file_path: str, fromfile: bool = False):
+        self.path = file_path
+        self.fromfile = fromfile
+        with numpy.load(file_path, allow_pickle=False) as npz:
+            fmt = npz['format'].item()
+            if isinstance(fmt, bytes):
+                fmt = fmt.decode('ascii')
+            rows, cols = (int(n) for n in npz['shape'])
+            self.shape = (rows, cols)
+            data = npz['data'].astype('<f8', copy=False)
+            if fmt == 'csc':
+                self._csc = self._check(npz['indptr'], npz['indices'], data,
+                                        cols, rows)
+                self._csr = None
+            elif fmt == 'csr':
+                self._csr = self._check(npz['indptr'], npz['indices'], data,
+                                        rows, cols)
+                self._csc = None
+            elif fmt == 'coo':
+                self._csc = _compress(npz['col'], npz['row'], data, cols)
+                self._csr = None
+            else:
+                raise ValueError(
+                    f'{file_path}: unsupported sparse format {fmt}')
+
+    def _check(self, indptr: numpy.ndarray, indices: numpy.ndarray,
+               data: numpy.ndarray, n_major: int, n_minor: int
+               ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        if (len(indptr) != n_major + 1 or len(indices) != len(data)
+                or indptr[-1] != len(data)
+                or (len(indices) > 0 and indices.max() >= n_minor)):
+            raise ValueError(f'{self.path}: the sparse matrix data do not '
+                             f'match its shape {self.shape}')
+        return indptr, indices, data
+
+    def _compressed(self, by_column: bool):
+        if by_column and self._csc is None:
+            self._csc = _transpose(self._csr, self.shape[0])
+        if not by_column and self._csr is None:
+            self._csr = _transpose(self._csc, self.shape[1])
+        return self._csc if by_column else self._csr
+
+    def _block(self, by_column: bool, start: int,
+               stop: int) -> numpy.ndarray:
+        # a dense block of columns (or rows) from the compressed entries;
+        # duplicate entries are summed as in SciPy
+        indptr, indices, data = self._compressed(by_column)
+        n = self.shape[0] if by_column else self.shape[1]
+        lo, hi = indptr[start], indptr[stop]
+        major = numpy.repeat(numpy.arange(stop - start),
+                             numpy.diff(indptr[start:stop + 1]))
+        flat = major * n + indices[lo:hi]
+        values = numpy.bincount(flat, weights=data[lo:hi],
+                                minlength=n * (stop - start))
+        if by_column:
+            return values.reshape((n, stop - start), order='F')
+        return values.reshape((stop - start, n))
+
+    def columns(self, start: int, stop: int) -> numpy.ndarray:
+        return self._block(True, start, stop)
+
+    def column(self, index: int) -> numpy.ndarray:
+        return self.columns(index, index + 1)[:, 0]
+
+    def column_blocks(self, block_size: Optional[int] = None
+                      ) -> Iterator[Tuple[int, numpy.ndarray]]:
+        rows, cols = self.shape
+        if block_size is None:
+            block_size = max(1, _MatrixReader.BLOCK_BYTES // (8 * rows or 1))
+        for start in range(0, cols, block_size):
+            yield start, self.columns(start, min(start + block_size, cols))
+
+    def row_blocks(self, block_size: Optional[int] = None
+                   ) -> Iterator[Tuple[int, numpy.ndarray]]:
+        rows, cols = self.shape
+        if block_size is None:
+            block_size = max(1, _MatrixReader.BLOCK_BYTES // (8 * cols or 1))
+        for start in range(0, rows, block_size):
+            yield start, self._block(False, start,
+                                     min(start + block_size, rows))
+
+
+def _compress(major: numpy.ndarray, minor: numpy.ndarray, data: numpy.ndarray,
+              n_major: int
+              ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Returns the index pointers, minor indices and values of the given
+    entries, compressed along the major axis."""
+    order = numpy.argsort(major, kind='stable')
+    counts = numpy.bincount(major, minlength=n_major)
+    indptr = numpy.concatenate(([0], numpy.cumsum(counts)))
+    return indptr, minor[order], data[order]
+
+
+def _transpose(compressed: Tuple[numpy.ndarray, numpy.ndarray,
+                                 numpy.ndarray], n_minor: int
+               ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    indptr, indices, data = compressed
+    major = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+    return _compress(indices, major, data, n_minor)
+
+
+_Matrix = Union[_MatrixReader, _SparseMatrixReader]
+
+_UNIT_USD_REF = {'@id': _RefIds.UNIT_USD}
+_QUANTITY_USD_REF = {'@id': _RefIds.QUANTITY_USD}
+
+
+def convert(folder_path, zip_path, bib_path=None, workers=1,
+            json_backend='auto', float_precision=None,
+            compression='deflate', compresslevel=None, stream=False,
+            incremental=False, fromfile=False):
+    """Converts the USEEIO model in the given folder to a JSON-LD package.
+
+    With `workers` > 1, the process data sets are created and serialized in
+    a pool of worker processes. They are still written to the package in
+    sector order by this thread, so the entries are the same as in a serial
+    conversion. `json_backend` and `float_precision` configure the JSON
+    encoder, see `_JsonEncoder`; `compression`, `compresslevel` and `stream`
+    configure the zip file, see `_PackageZip`.
+
+    With `incremental`, the process, impact category and demand data sets
+    whose inputs did not change since the previous conversion are copied
+    from the package at `zip_path` without re-compressing them, see
+    `_Manifest`. A non-incremental conversion removes the manifest of the
+    package it replaces.
+
+    The matrices are read in storage order, column by column for A and B and
+    in blocks of rows for C. With `fromfile`, dense matrices are read in
+    blocks via `numpy.fromfile` instead of being memory-mapped, see
+    `_MatrixReader`; sparse matrices are read by `_SparseMatrixReader`.
+    """
+    global _encoder
     if not _is_valid_useeio_folder(folder_path):
         return
+    _encoder = _JsonEncoder(json_backend, float_precision)
 
     source_list = []
     if bib_path:
@@ -186,9 +703,9 @@ def convert(folder_path, zip_path, bib_path=None):
         except:
             print('error generating source list')
     # read the matrix files
-    A = _read_matrix(os.path.join(folder_path, 'A.bin'))
-    B = _read_matrix(os.path.join(folder_path, 'B.bin'))
-    C = _read_matrix(os.path.join(folder_path, 'C.bin'))
+    A = _open_matrix(folder_path, 'A', fromfile)
+    B = _open_matrix(folder_path, 'B', fromfile)
+    C = _open_matrix(folder_path, 'C', fromfile)
 
     # read the meta data CSV files
     sector_rows = _read_csv(os.path.join(folder_path, 'sectors.csv'))
@@ -202,9 +719,35 @@ def convert(folder_path, zip_path, bib_path=None):
     demand_rows = _read_csv(os.path.join(folder_path, 'demands.csv'))
     demands: List[_Demand] = [_Demand(row) for row in demand_rows]
 
-    with zipfile.ZipFile(zip_path, mode='w',
-                         compression=zipfile.ZIP_DEFLATED) as zipf:
+    manifest = None
+    previous = None
+    out_path = zip_path
+    if incremental:
+        manifest = _Manifest(zip_path, {
+            'model_version': MODEL_VERSION,
+            'metadata': metadata,
+            'demand_metadata': demand_metadata,
+            'actors': actor_dict,
+            'sources': [s.json_obj() for s in source_list],
+            'sectors': sector_rows,
+            'flows': flow_rows,
+            'json_backend': _encoder.backend,
+            'float_precision': float_precision,
+            'compression': compression,
+            'compresslevel': compresslevel,
+        })
+        if manifest.load() and os.path.exists(zip_path):
+            previous = zipfile.ZipFile(zip_path)
+            out_path = zip_path + '.tmp'
+    elif os.path.exists(zip_path + '.manifest.json'):
+        os.remove(zip_path + '.manifest.json')
+
+    with _PackageZip(out_path, compression, compresslevel, stream,
+                     manifest, previous) as zipf:
         _write_ref_data(zipf)
+        # after the actors were written; parsing their metadata for the
+        # process documentation updates them in place
+        ctx = _Context(source_list)
         _write_sources(zipf, source_list)
         _write_sources(zipf, [_Source(useeio_source)])
         _write_categories(zipf, 'FLOW',
@@ -217,7 +760,11 @@ def convert(folder_path, zip_path, bib_path=None):
         _write_tech_flows(zipf, sectors)
         _write_envi_flows(zipf, env_flows, 'ELEMENTARY_FLOW')
         _write_envi_flows(zipf, waste_flows, 'WASTE_FLOW')
-        _write_processes(zipf, sectors, flows, A, B, source_list)
+        if workers > 1:
+            _write_processes_parallel(zipf, folder_path, sectors, flows,
+                                      A, B, ctx, workers)
+        else:
+            _write_processes(zipf, sectors, flows, A, B, ctx)
         _write_impacts(zipf, [i for i in indicators if i.group in indicators_to_write],
                               flows, C)
 
@@ -235,38 +782,235 @@ def convert(folder_path, zip_path, bib_path=None):
         for demand in demands:
             path = os.path.join(
                 folder_path, 'demands', f'{demand.demand_id}.json')
-            if os.path.exists(path):
-                with open(path, 'r', encoding='utf-8') as f:
-                    demand_data: List[dict] = json.load(f)
-                    _write_demand(zipf, demand, demand_data, sectors)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                raw = f.read()
+            names = [f'flows/{_uid("flow", demand.uid)}.json',
+                     f'processes/{demand.uid}.json']
+            if _reuse(zipf, names, demand.demand_id, demand.name,
+                      demand.location_code, raw):
+                continue
+            demand_data: List[dict] = json.loads(raw)
+            _write_demand(zipf, demand, demand_data, sectors, ctx)
+    if out_path != zip_path:
+        os.replace(out_path, zip_path)
+    if manifest is not None:
+        manifest.save()
+
+
+def convert_batch(jobs: List[Tuple[str, str]], bib_path=None, workers=1,
+                  **options) -> List[dict]:
+    """Converts the models of the given (folder, zip file) pairs in a pool
+    of `workers` processes, one model per process at a time.
+
+    The options are passed to `convert`. The reference data are serialized
+    once and shared with the workers. Returns a summary per model with the
+    `folder`, the `zip` file, the conversion time in `seconds`, the package
+    `size` in bytes and an `error` message or `None`.
+    """
+    global _encoder
+    _encoder = _JsonEncoder(options.get('json_backend', 'auto'),
+                            options.get('float_precision'))
+    _write_ref_data(_EntryList())
+    if workers <= 1:
+        return [_convert_job(folder, zip_path, bib_path, options)
+                for folder, zip_path in jobs]
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_batch_worker,
+            initargs=(NOW, _ref_data)) as pool:
+        futures = [pool.submit(_convert_job, folder, zip_path, bib_path,
+                               options)
+                   for folder, zip_path in jobs]
+        return [f.result() for f in futures]
+
+
+def _init_batch_worker(now: str, ref_data: dict):
+    global NOW
+    NOW = now
+    _ref_data.update(ref_data)
+
+
+def _convert_job(folder: str, zip_path: str, bib_path: Optional[str],
+                 options: dict) -> dict:
+    result = {'folder': folder, 'zip': zip_path, 'seconds': 0.0,
+              'size': 0, 'error': None}
+    start = time.perf_counter()
+    try:
+        if not _is_valid_useeio_folder(folder):
+            result['error'] = 'not a USEEIO model folder'
+        else:
+            convert(folder, zip_path, bib_path, **options)
+            result['size'] = os.path.getsize(zip_path)
+    except Exception as e:
+        log.exception('failed to convert %s', folder)
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _batch_jobs(source: str, out_dir: str) -> List[Tuple[str, str]]:
+    """Returns the (folder, zip file) pairs of a batch conversion. `source`
+    is a manifest file with a model folder and an optional zip file per line,
+    separated by a comma, or a glob pattern of model folders. Relative paths
+    in a manifest are resolved against its folder; zip files default to
+    `<out_dir>/<folder name>.zip`."""
+    if os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r', encoding='utf-8') as f:
+            rows = [row for row in csv.reader(f)
+                    if row and row[0].strip()
+                    and not row[0].lstrip().startswith('#')]
+        pairs = [(os.path.join(base, row[0].strip()),
+                  os.path.join(base, row[1].strip())
+                  if len(row) > 1 and row[1].strip() else None)
+                 for row in rows]
+    else:
+        pairs = [(folder, None) for folder in sorted(glob.glob(source))
+                 if os.path.isdir(folder)]
+    jobs = []
+    for folder, zip_path in pairs:
+        if zip_path is None:
+            name = os.path.basename(os.path.normpath(folder))
+            zip_path = os.path.join(out_dir, name + '.zip')
+        jobs.append((folder, zip_path))
+    return jobs
+
+
+def _print_batch_summary(results: List[dict]):
+    width = max([len('model')] + [len(r['folder']) for r in results])
+    print(f'{"model":<{width}}  {"time [s]":>9}  {"size [MB]":>9}  status')
+    for r in results:
+        status = r['error'] or 'ok'
+        print(f'{r["folder"]:<{width}}  {r["seconds"]:>9.2f}  '
+              f'{r["size"] / 1e6:>9.2f}  {status}')
+    total = sum(r['seconds'] for r in results)
+    failed = sum(1 for r in results if r['error'])
+    print(f'{len(results)} models, {failed} failed, '
+          f'{total:.2f} s conversion time')
 
 
 def _write_processes(zip_file: zipfile.ZipFile, sectors: List[_Sector],
-                     flows: List[_Flow], A: numpy.ndarray, B: numpy.ndarray,
-                     source_list: List[_Source]):
-    for sector in sectors:
-        process = _init_process(sector, source_list)
-        exchanges: List[dict] = process['exchanges']
-        iid = 1
+                     flows: List[_Flow], A: _Matrix, B: _Matrix,
+                     ctx: _Context):
+    # walk A and B column by column, i.e. in the order of the sectors' matrix
+    # indices, as they are stored
+    sector_refs = _SectorRefs(sectors)
+    flow_refs = _FlowRefs(flows)
+    by_column = {sector.index: sector for sector in sectors}
+    size = max(1, _MatrixReader.BLOCK_BYTES // (8 * (A.shape[0] + B.shape[0])))
+    for (start, a_block), (_, b_block) in zip(A.column_blocks(size),
+                                              B.column_blocks(size)):
+        for j in range(a_block.shape[1]):
+            sector = by_column.get(start + j)
+            if sector is None:
+                continue
+            a, b = a_block[:, j], b_block[:, j]
+            if _reuse_process(zip_file, sector, a, b):
+                continue
+            process = _create_process(sector, a, b, ctx,
+                                      sector_refs, flow_refs)
+            _write_obj(zip_file, 'processes', process)
+
+
+def _reuse_process(zip_file: zipfile.ZipFile, sector: _Sector,
+                   a: numpy.ndarray, b: numpy.ndarray) -> bool:
+    name = f'processes/{_uid("process", sector.uid)}.json'
+    return _reuse(zip_file, [name], a, b)
+
+
+def _create_process(sector: _Sector, a: numpy.ndarray, b: numpy.ndarray,
+                    ctx: _Context, sector_refs: _SectorRefs,
+                    flow_refs: _FlowRefs) -> dict:
+    # `a` and `b` are the columns of the sector in A and B
+    process = _init_process(sector, ctx)
+    exchanges: List[dict] = process['exchanges']
+    iid = 1
 
-        # add tech-flows
-        for tech_flow in _create_tech_exchanges(sector, sectors, A):
-            iid += 1
-            tech_flow['internalId'] = iid
-            exchanges.append(tech_flow)
+    # add tech-flows
+    for tech_flow in _create_tech_exchanges(a, sector_refs):
+        iid += 1
+        tech_flow['internalId'] = iid
+        exchanges.append(tech_flow)
 
-        # add envi-flows
-        for envi_flow in _create_envi_exchanges(sector, flows, B):
-            iid += 1
-            envi_flow['internalId'] = iid
-            exchanges.append(envi_flow)
+    # add envi-flows
+    for envi_flow in _create_envi_exchanges(b, flow_refs):
+        iid += 1
+        envi_flow['internalId'] = iid
+        exchanges.append(envi_flow)
 
-        process['lastInternalId'] = iid
-        _write_obj(zip_file, 'processes', process)
+    process['lastInternalId'] = iid
+    return process
+
+
+def _write_processes_parallel(zip_file: zipfile.ZipFile, folder_path: str,
+                              sectors: List[_Sector], flows: List[_Flow],
+                              A: _Matrix, B: _Matrix,
+                              ctx: _Context, workers: int,
+                              chunk_size: int = 16):
+    # the workers build and serialize chunks of processes; this thread is the
+    # only writer and takes the chunks in order, with a bounded number of
+    # chunks in flight. In an incremental conversion, the unchanged processes
+    # are copied first and only the others are given to the workers; the
+    # columns are only read for this when there is a manifest
+    positions = list(range(len(sectors)))
+    if isinstance(zip_file, _PackageZip) and zip_file.manifest is not None:
+        positions = [i for i in positions
+                     if not _reuse_process(zip_file, sectors[i],
+                                           A.column(sectors[i].index),
+                                           B.column(sectors[i].index))]
+    chunks = [positions[i:i + chunk_size]
+              for i in range(0, len(positions), chunk_size)]
+    init_args = (folder_path, A.fromfile, sectors, flows, ctx,
+                 NOW, metadata, actor_dict, _encoder)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_process_worker,
+            initargs=init_args) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_serialize_processes, chunk))
+            if len(pending) >= 2 * workers:
+                _write_entries(zip_file, pending.popleft().result())
+        while pending:
+            _write_entries(zip_file, pending.popleft().result())
+
+
+_worker: dict = {}
+
+
+def _init_process_worker(folder_path: str, fromfile: bool,
+                         sectors: List[_Sector],
+                         flows: List[_Flow], ctx: _Context,
+                         now: str, meta: dict, actors: dict,
+                         encoder: '_JsonEncoder'):
+    global NOW, metadata, actor_dict, _encoder
+    NOW, metadata, actor_dict, _encoder = now, meta, actors, encoder
+    _worker['A'] = _open_matrix(folder_path, 'A', fromfile)
+    _worker['B'] = _open_matrix(folder_path, 'B', fromfile)
+    _worker['sectors'] = sectors
+    _worker['flows'] = flows
+    _worker['ctx'] = ctx
+    _worker['sector_refs'] = _SectorRefs(sectors)
+    _worker['flow_refs'] = _FlowRefs(flows)
+
+
+def _serialize_processes(
+        positions: List[int]) -> List[Tuple[str, Union[str, bytes]]]:
+    w = _worker
+    entries = []
+    for i in positions:
+        sector = w['sectors'][i]
+        process = _create_process(
+            sector, w['A'].column(sector.index), w['B'].column(sector.index),
+            w['ctx'], w['sector_refs'], w['flow_refs'])
+        entry = _serialize_obj('processes', process)
+        if entry:
+            entries.append(entry)
+    return entries
 
 
 def _write_demand(zip_file: zipfile.ZipFile, demand: _Demand,
-                  data: List[dict], sectors: List[_Sector]):
+                  data: List[dict], sectors: List[_Sector], ctx: _Context):
     # create the demand flow
     flow = {
         '@type': 'Flow',
@@ -292,7 +1036,7 @@ def _write_demand(zip_file: zipfile.ZipFile, demand: _Demand,
         'version': MODEL_VERSION,
         'description': demand_metadata['description'],
         'processType': 'UNIT_PROCESS',
-        'processDocumentation': _process_doc(demand_metadata),
+        'processDocumentation': ctx.demand_doc,
     }
     if demand.location_code == 'US':
         process['location'] = {'@id': _RefIds.LOCATION_US}
@@ -342,10 +1086,12 @@ def _write_demand(zip_file: zipfile.ZipFile, demand: _Demand,
 
 
 def _is_valid_useeio_folder(folder: str) -> bool:
+    for matrix in ('A', 'B', 'C'):
+        if _matrix_file(folder, matrix) is None:
+            log.error("required matrix '%s' (%s.bin or %s.npz) is missing "
+                      "in '%s'", matrix, matrix, matrix, folder)
+            return False
     required_files = [
-        'A.bin',
-        'B.bin',
-        'C.bin',
         'flows.csv',
         'sectors.csv',
         'indicators.csv',
@@ -359,6 +1105,24 @@ def _is_valid_useeio_folder(folder: str) -> bool:
     return True
 
 
+def _matrix_file(folder: str, matrix: str) -> Optional[str]:
+    """Returns the path of the dense (`.bin`) or, if there is none, of the
+    sparse (`.npz`) file of the given matrix in the folder."""
+    for ext in ('.bin', '.npz'):
+        path = os.path.join(folder, matrix + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _open_matrix(folder: str, matrix: str,
+                 fromfile: bool = False) -> _Matrix:
+    path = _matrix_file(folder, matrix)
+    if path.endswith('.npz'):
+        return _SparseMatrixReader(path, fromfile)
+    return _MatrixReader(path, fromfile)
+
+
 def _read_csv(file_path: str) -> List[List[str]]:
     with open(file_path, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
@@ -373,12 +1137,6 @@ def _read_matrix_shape(file_path: str) -> Tuple[int, int]:
         return rows, cols
 
 
-def _read_matrix(file_path: str) -> numpy.ndarray:
-    shape = _read_matrix_shape(file_path)
-    return numpy.memmap(
-        file_path, mode='c', dtype='<f8', shape=shape, offset=8, order='F')
-
-
 def _uid(*xs: str) -> str:
     path: List[str] = []
     for arg in xs:
@@ -388,7 +1146,28 @@ def _uid(*xs: str) -> str:
     return str(uuid.uuid3(uuid.NAMESPACE_OID, '/'.join(path)))
 
 
+_ref_data: Dict[str, List[Tuple[str, Union[str, bytes]]]] = {}
+
+
+class _EntryList(list):
+    """Collects the entries that `_write_obj` writes to it."""
+
+    def writestr(self, name: str, data: Union[str, bytes]):
+        self.append((name, data))
+
+
 def _write_ref_data(zip_file: zipfile.ZipFile):
+    # the reference data are the same for all models and are serialized only
+    # once per JSON backend
+    entries = _ref_data.get(_encoder.backend)
+    if entries is None:
+        entries = _EntryList()
+        _create_ref_data(entries)
+        _ref_data[_encoder.backend] = entries
+    _write_entries(zip_file, entries)
+
+
+def _create_ref_data(zip_file: zipfile.ZipFile):
     _write_obj(zip_file, 'locations', {
         "@type": "Location",
         "@id": _RefIds.LOCATION_US,
@@ -654,7 +1433,7 @@ def _write_envi_flows(zip_file: zipfile.ZipFile, flows: List[_Flow],
         _write_obj(zip_file, 'flows', obj)
 
 
-def _init_process(sector: _Sector, source_list: List[_Source]) -> dict:
+def _init_process(sector: _Sector, ctx: _Context) -> dict:
 
     obj = {
         '@type': 'Process',
@@ -663,7 +1442,7 @@ def _init_process(sector: _Sector, source_list: List[_Source]) -> dict:
         'version': MODEL_VERSION,
         'description': _conc_meta([sector.description, metadata['description']]),
         'processType': 'UNIT_PROCESS',
-        'processDocumentation': _process_doc(metadata, source_list),
+        'processDocumentation': ctx.process_doc,
         'lastInternalId': 1,
         'exchanges': [
             {
@@ -686,47 +1465,48 @@ def _init_process(sector: _Sector, source_list: List[_Source]) -> dict:
     return obj
 
 
-def _create_tech_exchanges(sector: _Sector, sectors: List[_Sector],
-                           A: numpy.ndarray) -> List[dict]:
-    col = sector.index
+def _row_indices(items: list) -> numpy.ndarray:
+    """Returns the matrix row indices of the given sectors or flows."""
+    return numpy.array([item.index for item in items], dtype=numpy.intp)
+
+
+def _create_tech_exchanges(a: numpy.ndarray,
+                           refs: _SectorRefs) -> List[dict]:
+    # visit only the non-zero entries of the sector's column `a` of A, in
+    # the order of the sectors
+    column = numpy.asarray(a)[refs.rows]
+    nonzero = numpy.flatnonzero(column)
     exchanges = []
-    for other in sectors:
-        row = other.index
-        amount = A[row, col]
-        if amount == 0:
-            continue
+    for i, amount in zip(nonzero.tolist(), _encoder.floats(column[nonzero])):
         exchanges.append({
             'input': True,
             'amount': amount,
-            'flow': {'@id': _uid('flow', other.uid)},
-            'unit': {'@id': _RefIds.UNIT_USD},
-            'flowProperty': {'@id': _RefIds.QUANTITY_USD},
-            'defaultProvider': {'@id': _uid('process', other.uid)}
+            'flow': refs.flows[i],
+            'unit': _UNIT_USD_REF,
+            'flowProperty': _QUANTITY_USD_REF,
+            'defaultProvider': refs.providers[i]
         })
     return exchanges
 
 
-def _create_envi_exchanges(sector: _Sector, flows: List[_Flow],
-                           B: numpy.ndarray) -> List[dict]:
-    col = sector.index
+def _create_envi_exchanges(b: numpy.ndarray,
+                           refs: _FlowRefs) -> List[dict]:
+    column = numpy.asarray(b)[refs.rows]
+    nonzero = numpy.flatnonzero(column)
     exchanges = []
-    for flow in flows:
-        row = flow.index
-        amount = B[row, col]
-        if amount == 0:
-            continue
+    for i, amount in zip(nonzero.tolist(), _encoder.floats(column[nonzero])):
         exchanges.append({
-            'input': flow.context.lower().strip().startswith('resource'),
+            'input': refs.inputs[i],
             'amount': amount,
-            'flow': {'@id': flow.uid},
-            'unit': {'@id': _RefIds.of_unit(flow.unit)},
-            'flowProperty': {'@id': _RefIds.of_quantity(flow.unit)}
+            'flow': refs.flows[i],
+            'unit': refs.units[i],
+            'flowProperty': refs.quantities[i]
         })
     return exchanges
 
 
 def _write_impacts(zip_file: zipfile.ZipFile, indicators: List[_Indicator],
-                   flows: List[_Flow], C: numpy.ndarray):
+                   flows: List[_Flow], C: _Matrix):
     # create the categories for the impacts
     categories: Dict[str, dict] = {}
     for indicator in indicators:
@@ -741,31 +1521,15 @@ def _write_impacts(zip_file: zipfile.ZipFile, indicators: List[_Indicator],
         categories[indicator.group] = obj
         _write_obj(zip_file, 'categories', obj)
 
-    # write the impact categories
-    for indicator in indicators:
-        obj = {
-            '@type': 'ImpactCategory',
-            '@id': indicator.uid,
-            'name': indicator.name,
-            'category': categories.get(indicator.group),
-            'referenceUnitName': indicator.unit,
-        }
-
-        factors: List[dict] = []
-        row = indicator.index
-        for flow in flows:
-            value = C[row, flow.index]
-            if value == 0:
+    # write the impact categories, walking C in blocks of indicator rows
+    flow_refs = _FlowRefs(flows)
+    by_row = {indicator.index: indicator for indicator in indicators}
+    for start, block in C.row_blocks():
+        for k in range(block.shape[0]):
+            indicator = by_row.get(start + k)
+            if indicator is None:
                 continue
-            factors.append({
-                'value': value,
-                'flow': {'@id': flow.uid},
-                'unit': {'@id': _RefIds.of_unit(flow.unit)},
-                'flowProperty': {'@id': _RefIds.of_quantity(flow.unit)},
-            })
-
-        obj['impactFactors'] = factors
-        _write_obj(zip_file, 'lcia_categories', obj)
+            _write_impact(zip_file, indicator, block[k], categories, flow_refs)
 
     # write the LCIA method
     method = {
@@ -781,13 +1545,74 @@ def _write_impacts(zip_file: zipfile.ZipFile, indicators: List[_Indicator],
     _write_obj(zip_file, 'lcia_methods', method)
 
 
+def _write_impact(zip_file: zipfile.ZipFile, indicator: _Indicator,
+                  c: numpy.ndarray, categories: Dict[str, dict],
+                  flow_refs: _FlowRefs):
+    # `c` is the row of the indicator in C
+    if _reuse(zip_file, [f'lcia_categories/{indicator.uid}.json'],
+              indicator.name, indicator.group, indicator.unit, c):
+        return
+    obj = {
+        '@type': 'ImpactCategory',
+        '@id': indicator.uid,
+        'name': indicator.name,
+        'category': categories.get(indicator.group),
+        'referenceUnitName': indicator.unit,
+    }
+
+    # create factors only for the non-zero entries of the row, from the
+    # prepared factor templates
+    row = c[flow_refs.rows]
+    nonzero = numpy.flatnonzero(row)
+    templates = flow_refs.factors
+    factors: List[dict] = [
+        {'value': value, **templates[i]}
+        for i, value in zip(nonzero.tolist(), _encoder.floats(row[nonzero]))
+    ]
+
+    obj['impactFactors'] = factors
+    _write_obj(zip_file, 'lcia_categories', obj)
+
+
+def _reuse(zip_file: zipfile.ZipFile, names: List[str], *inputs) -> bool:
+    """Returns `True` when the entries with the given names were copied from
+    the previous package because their inputs did not change."""
+    if not isinstance(zip_file, _PackageZip) or zip_file.manifest is None:
+        return False
+    return zip_file.reuse(names, zip_file.manifest.digest(*inputs))
+
+
 def _write_obj(zip_file: zipfile.ZipFile, path: str, obj: dict):
+    name = _entry_name(path, obj)
+    if not name:
+        return
+    if isinstance(zip_file, _PackageZip):
+        zip_file.write_json(name, obj)
+    else:
+        zip_file.writestr(name, _encoder.dumps(obj))
+
+
+def _serialize_obj(path: str,
+                   obj: dict) -> Optional[Tuple[str, Union[str, bytes]]]:
+    name = _entry_name(path, obj)
+    if not name:
+        return None
+    return name, _encoder.dumps(obj)
+
+
+def _entry_name(path: str, obj: dict) -> Optional[str]:
     uid = obj.get('@id')
     obj["@context"] = "http://greendelta.github.io/olca-schema/"
     if uid is None or uid == '':
         log.error('invalid @id for object %s in %s', obj, path)
-        return
-    zip_file.writestr(f'{path}/{uid}.json', json.dumps(obj))
+        return None
+    return f'{path}/{uid}.json'
+
+
+def _write_entries(zip_file: zipfile.ZipFile,
+                   entries: List[Tuple[str, Union[str, bytes]]]):
+    for name, data in entries:
+        zip_file.writestr(name, data)
 
 
 def _read_metadata(path=None):
@@ -831,9 +1656,11 @@ def _conc_meta(m):
 def _process_doc(m, source_list=None):
     source_ids = []
     if source_list:
-        source_ids = [{'@type': s.json_obj()['@type'],
-                       '@id': s.json_obj()['@id'],
-                       'name': s.json_obj()['name']} for s in source_list]
+        for s in source_list:
+            obj = s.json_obj()
+            source_ids.append({'@type': obj['@type'], '@id': obj['@id'],
+                               'name': obj['name']})
+    generator = _parse_metadata(actor_dict, 'generator')['id']
 
     proc_dict = {'validFrom': datetime.datetime(TARGET_YEAR, 1, 1).isoformat(timespec='seconds'),
                  'validUntil': datetime.datetime(TARGET_YEAR, 12, 31).isoformat(timespec='seconds'),
@@ -843,8 +1670,8 @@ def _process_doc(m, source_list=None):
 
                  'intendedApplication': m['intended_application'],
                  'dataSetOwner': {'@id': _parse_metadata(actor_dict, 'owner')['id']},
-                 'dataGenerator': {'@id': _parse_metadata(actor_dict, 'generator')['id']},
-                 'dataDocumentor': {'@id': _parse_metadata(actor_dict, 'generator')['id']},
+                 'dataGenerator': {'@id': generator},
+                 'dataDocumentor': {'@id': generator},
                  'publication': {'@id': _Source(useeio_source).json_obj()['@id']},
                  'restrictionsDescription': m['access_restrictions'],
                  'projectDescription': m['project'],
@@ -939,17 +1766,57 @@ actor_dict = _read_metadata(os.path.dirname(__file__) + "/useeio_actors.yml")
 
 
 if __name__ == '__main__':
-    args = sys.argv
-    if len(args) < 3:
-        print("""
-A simple USEEIO (matrix API export) to openLCA (JSON-LD) converter
-
-Usage:
-
-  $ python3 [USEEIO data folder] [openLCA JSON-LD zip file]
-""")
+    parser = argparse.ArgumentParser(
+        description='A simple USEEIO (matrix API export) to openLCA (JSON-LD) '
+                    'converter')
+    parser.add_argument('folder', help='USEEIO data folder; with --batch a '
+                                       'glob pattern or manifest file of '
+                                       'folders')
+    parser.add_argument('zip', help='openLCA JSON-LD zip file; with --batch '
+                                    'the output folder')
+    parser.add_argument('bib', nargs='?', default=None,
+                        help='optional BibTeX file of the model sources')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes that create the process '
+                             'data sets; with --batch the number of models '
+                             'converted concurrently')
+    parser.add_argument('--batch', action='store_true',
+                        help='convert all model folders matching a glob '
+                             'pattern or listed in a manifest file')
+    parser.add_argument('--json-backend', default='auto',
+                        choices=['auto', 'orjson', 'json'],
+                        help='JSON encoder; `json` reproduces the output of '
+                             'earlier versions byte by byte')
+    parser.add_argument('--float-precision', type=int, default=None,
+                        help='significant digits of matrix values')
+    parser.add_argument('--compression', default='deflate',
+                        choices=['stored', 'deflate'],
+                        help='`stored` for a fast package, e.g. for a local '
+                             'import, `deflate` for a small package')
+    parser.add_argument('--level', type=int, default=None,
+                        choices=range(1, 10), metavar='1-9',
+                        help='deflate compression level')
+    parser.add_argument('--stream', action='store_true',
+                        help='encode objects directly into the zip entries')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only re-create the data sets whose inputs '
+                             'changed since the previous conversion')
+    parser.add_argument('--fromfile', action='store_true',
+                        help='read the matrices in blocks instead of '
+                             'memory-mapping them')
+    args = parser.parse_args()
+    if args.float_precision is not None and args.float_precision < 1:
+        parser.error('--float-precision must be at least 1')
+    options = dict(json_backend=args.json_backend,
+                   float_precision=args.float_precision,
+                   compression=args.compression, compresslevel=args.level,
+                   stream=args.stream, incremental=args.incremental,
+                   fromfile=args.fromfile)
+    if args.batch:
+        os.makedirs(args.zip, exist_ok=True)
+        results = convert_batch(_batch_jobs(args.folder, args.zip), args.bib,
+                                workers=args.workers, **options)
+        _print_batch_summary(results)
     else:
-        bib_path = None
-        if len(args) == 4:
-            bib_path = args[3]
-        convert(args[1], args[2], bib_path)
+        convert(args.folder, args.zip, args.bib, workers=args.workers,
+                **options)